@@ -0,0 +1,92 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from bluetooth_send2 import CameraSender
+from camera_receiver import CameraReceiver
+from camera_transport import create_transport
+from outbound_queue import OutboundQueue, OutboundDrainer
+
+
+def bench(args):
+    """複数のステーション → 1台の受信側 の経路に通知を流し、送達時間と件数を計測"""
+    transport = create_transport(args.transport)
+    address = "127.0.0.1" if args.transport == "tcp" else "camera"
+    port = args.port if args.port is not None else transport.default_port
+
+    received = []
+    lock = threading.Lock()
+
+    def on_event(station, uid, tapped_at):
+        with lock:
+            received.append(time.time() - tapped_at)
+
+    receiver = CameraReceiver(on_event, max_clients=max(16, args.stations))
+    server = transport.listen(address, port, args.stations)
+    running = True
+    server_thread = threading.Thread(target=receiver.serve, args=(server, lambda: running), daemon=True)
+    server_thread.start()
+
+    workdir = tempfile.mkdtemp(prefix="bench_camera_link_")
+    stations = []
+    for index in range(args.stations):
+        sender = CameraSender(address, port, transport=transport, keepalive_interval=60.0)
+        queue = OutboundQueue(os.path.join(workdir, f"outbox-{index}.log"), fsync=not args.no_fsync).open()
+        drainer = OutboundDrainer(queue, sender, batch_size=args.batch)
+        sender.start()
+        drainer.start()
+        stations.append((sender, queue, drainer))
+
+    total = args.stations * args.taps
+    started = time.perf_counter()
+    enqueue = []
+    for tap in range(args.taps):
+        for index, (_, queue, _) in enumerate(stations):
+            put_started = time.perf_counter()
+            queue.put({"station": index + 1, "uid": f"04{tap:012x}", "tapped_at": time.time()})
+            enqueue.append(time.perf_counter() - put_started)
+        if args.interval:
+            time.sleep(args.interval)
+    deadline = time.monotonic() + args.timeout
+    while len(received) < total and time.monotonic() < deadline:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - started
+
+    for sender, queue, drainer in stations:
+        drainer.stop()
+        sender.close()
+        queue.close()
+    running = False
+    server_thread.join(2.0)
+    server.close()
+    return received, enqueue, elapsed, receiver.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ステーション → カメラレコーダーの経路を1台のPCで負荷計測")
+    parser.add_argument('--transport', default='loopback', choices=('loopback', 'tcp'))
+    parser.add_argument('--port', type=int, help="TCPの場合の待受ポート")
+    parser.add_argument('--stations', type=int, default=4)
+    parser.add_argument('--taps', type=int, default=200, help="ステーションごとのタップ数")
+    parser.add_argument('--interval', type=float, default=0.0, help="タップの間隔（秒）")
+    parser.add_argument('--batch', type=int, default=20, help="1回の送信にまとめる最大件数")
+    parser.add_argument('--no-fsync', action='store_true', help="送信キューの書き込みごとの fsync を省略")
+    parser.add_argument('--timeout', type=float, default=30.0)
+    args = parser.parse_args()
+
+    received, enqueue, elapsed, stats = bench(args)
+    total = args.stations * args.taps
+    print(f"送達: {len(received)}/{total} 件  {elapsed:.2f}秒  {len(received) / elapsed:.0f} 件/秒")
+    if received:
+        received.sort()
+        print(f"送達時間: 中央値 {received[len(received) // 2] * 1000:.1f}ms  "
+              f"95% {received[int(len(received) * 0.95) - 1] * 1000:.1f}ms  最大 {received[-1] * 1000:.1f}ms")
+    enqueue.sort()
+    print(f"キュー登録: 中央値 {enqueue[len(enqueue) // 2] * 1000:.2f}ms  最大 {enqueue[-1] * 1000:.2f}ms")
+    print(f"受信側: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import argparse
+import time
+
+from ndef_codec import TemplateCache
+from pn532_sim import SimulatedPN532, SimulatedTag, LatencyModel, TAG_TYPES
+from tag_capability import CapabilityCache
+from tag_session import TagSession
+from tag_writer import write_ndef, verify_write, check_fingerprint
+
+
+def provision(pn532, capabilities, templates, uid, delta=True):
+    """main.py の書き込みステージと同じ手順（確認 → 種別判定 → 書き込み → 検証）"""
+    template = templates.get(uid)
+    data = template.render(uid)
+    with TagSession(pn532, uid=uid, selected=True) as session:
+        # 書き込み済みのタグは READ 1回だけで終わる（種別判定は書き込む場合のみ）
+        if template.use_fingerprint and check_fingerprint(session, template.tlv):
+            return "skip", session.summary()
+        capability = capabilities.detect(session)
+        if len(data) > capability.capacity:
+            return "capacity", session.summary()
+        result = write_ndef(session, data, capacity=capability.capacity, delta=delta)
+        if result.written:
+            verify = verify_write(session, data, use_fast_read=capability.fast_read)
+            if not verify.ok:
+                return f"verify {verify.status}", session.summary()
+    return "write", session.summary()
+
+
+def bench(args):
+    """新しいタグを順にかざし、1タップあたりの所要時間を計測"""
+    latency = LatencyModel(scale=args.scale, jitter=args.jitter, seed=1)
+    pn532 = SimulatedPN532(latency=latency)
+    pn532.SAM_configuration()
+    capabilities = CapabilityCache()
+    templates = TemplateCache(args.base_url, args.encoding)
+
+    elapsed = []
+    outcomes = {}
+    for index in range(args.taps):
+        if index % args.repeat == 0:
+            tag = SimulatedTag(tag_type=args.tag_type)
+        pn532.place(tag)
+        started = time.perf_counter()
+        uid = pn532.read_passive_target(timeout=1)
+        outcome, summary = provision(pn532, capabilities, templates, bytes(uid), delta=not args.full)
+        elapsed.append(time.perf_counter() - started)
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        pn532.remove(tag)
+    return elapsed, outcomes, pn532.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PN532シミュレータで書き込みステージのスループットを計測")
+    parser.add_argument('--taps', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=1, help="同じタグを続けてかざす回数")
+    parser.add_argument('--tag-type', default='NTAG213', choices=sorted(TAG_TYPES))
+    parser.add_argument('--full', action='store_true', help="差分書き込みを使わない")
+    parser.add_argument('--scale', type=float, default=1.0, help="レイテンシの倍率（0 で待ち時間なし）")
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--base-url', default='https://akioka-sub.cloud/questionnaire/')
+    parser.add_argument('--encoding', default='hex')
+    args = parser.parse_args()
+
+    elapsed, outcomes, stats = bench(args)
+    elapsed.sort()
+    total = sum(elapsed)
+    print(f"タップ数: {len(elapsed)} {outcomes}")
+    print(f"1タップ: 平均 {total / len(elapsed) * 1000:.1f}ms  中央値 {elapsed[len(elapsed) // 2] * 1000:.1f}ms  "
+          f"最大 {elapsed[-1] * 1000:.1f}ms")
+    print(f"スループット: {len(elapsed) * 60 / total:.1f} タップ/分")
+    print("コマンド別:")
+    for command, entry in sorted(stats.items()):
+        print(f"  {command}: {entry['count']:>5} 回 {entry['total_ms']:>9.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import time
+
+from ndef_codec import build_uri_tlv, with_fingerprint, page_count, PAGE_SIZE
+from url_codec import ENCODINGS, build_tag_url
+
+# nfc_reader.log の実測値（36ページ書き込みで約550ms）から求めた1ページあたりの書き込み時間
+WRITE_PAGE_SECONDS = 0.0153
+
+SAMPLE_UID = bytes.fromhex('04fb6801c22a81')
+
+
+def bench_case(base_url, encoding, pn532=None, repeat=5):
+    """1つのエンコード方式についてページ数と書き込み時間を計測"""
+    url = build_tag_url(base_url, SAMPLE_UID, encoding)
+    data = with_fingerprint(build_uri_tlv(url))
+    pages = page_count(len(data))
+    if pn532 is None:
+        write_ms = pages * WRITE_PAGE_SECONDS * 1000
+    else:
+        from tag_writer import write_pages
+        elapsed = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            write_pages(pn532, data)
+            elapsed.append(time.perf_counter() - started)
+        write_ms = sorted(elapsed)[len(elapsed) // 2] * 1000
+    return url, len(data), pages, write_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UIDエンコード方式ごとのページ数・書き込み時間")
+    parser.add_argument('--base-url', default='https://akioka-sub.cloud/questionnaire/')
+    parser.add_argument('--compact-base-url', default='https://akioka-sub.cloud/q/')
+    parser.add_argument('--hardware', action='store_true', help="PN532に置いたタグへ実際に書き込んで計測")
+    parser.add_argument('--simulate', action='store_true', help="PN532シミュレータ上のタグへ書き込んで計測")
+    args = parser.parse_args()
+
+    pn532 = None
+    if args.hardware or args.simulate:
+        from pn532_hal import open_pn532
+        from pn532_sim import SimulatedTag
+        pn532 = open_pn532({"reader_backend": "simulator" if args.simulate else "pn532"})
+        if args.simulate:
+            pn532.place(SimulatedTag(SAMPLE_UID))
+        print("タグをかざしてください...")
+        while pn532.read_passive_target(timeout=1) is None:
+            pass
+
+    mode = ("シミュレータ" if args.simulate else "実測") if pn532 else f"推定 ({WRITE_PAGE_SECONDS * 1000:.1f}ms/ページ)"
+    print(f"書き込み時間: {mode}")
+    print(f"{'encoding':<10} {'bytes':>5} {'pages':>5} {'write_ms':>8}  url")
+    cases = [('hex', args.base_url)]
+    cases += [(encoding, args.base_url) for encoding in ENCODINGS if encoding != 'hex']
+    cases += [(encoding, args.compact_base_url) for encoding in ENCODINGS if encoding != 'hex']
+    for encoding, base_url in cases:
+        url, size, pages, write_ms = bench_case(base_url, encoding, pn532)
+        print(f"{encoding:<10} {size:>5} {pages:>5} {write_ms:>8.1f}  {url}")
+    print(f"参考: 従来の全ページ書き込み 144 バイト / {144 // PAGE_SIZE} ページ")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,325 @@
-import bluetooth
+import random
+import struct
+import threading
+import time
+import logging
 
-def send_message(message):
-    """Bluetoothでメッセージを送信する関数"""
-    server_mac_address = "D8:3A:DD:85:B6:0F"
-    port = 1  # 通常RFCOMMのポートは1を使うことが多いです
+from camera_transport import RfcommTransport, create_transport
+from circuit_breaker import CircuitBreaker, HALF_OPEN, CLOSED
+from camera_protocol import (FrameDecoder, ProtocolError, encode_event, new_sender_id, parse_legacy_message,
+                             FRAME_ACK, KEEPALIVE_FRAME)
 
-    sock = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
-    sock.connect((server_mac_address, port))
+logger = logging.getLogger(__name__)
 
-    sock.send(message)
-    print("Message sent.")
+SERVER_MAC_ADDRESS = "D8:3A:DD:85:B6:0F"
+PORT = 1  # 通常RFCOMMのポートは1を使うことが多いです
+
+
+class SenderUnavailableError(Exception):
+    """再接続の待ち時間中のため送信できない"""
+
+
+class AckTimeoutError(OSError):
+    """送信したイベントの ACK が期限までに届かなかった"""
+
+
+def _event_fields(message, queued_at):
+    """送信キューのメッセージを (ステーションID, UID, タップ時刻) にする"""
+    if isinstance(message, dict):
+        return message['station'], message['uid'], message.get('tapped_at', queued_at)
+    station, uid = parse_legacy_message(message)
+    return station, uid, queued_at
+
+
+def validate_message(message):
+    """送信キューのメッセージがEVENTフレームにできるか確認（できない場合は ValueError）"""
+    try:
+        station, uid, tapped_at = _event_fields(message, time.time())
+        encode_event(bytearray(), 0, 0, station, uid, tapped_at)
+    except (KeyError, TypeError, ValueError, struct.error) as e:
+        raise ValueError(f"EVENTフレームにできません: {e}") from e
+
+
+class CameraSender:
+    """カメラレコーダーへの接続を張ったままにして送信する
+
+    タップごとに接続・切断していた send_message と違い、接続は1本を使い回すため
+    通知1件あたりの処理は send 1回で済む。
+    - 接続には camera_transport のトランスポート（RFCOMM / TCP / ループバック）を使う
+    - 送信は camera_protocol のフレーム形式で、deliver() は受信側の累積ACKまで待つ
+    - send()/deliver() はロックで直列化しているので、どのスレッドから呼んでもよい
+    - keepalive_interval 秒ごとにキープアライブを送り、切れた接続を次のタップより先に検出する
+    - 接続に失敗した場合は initial_backoff 秒から max_backoff 秒まで倍々に
+      （±jitter の割合でばらつかせて）間隔を空け、バックグラウンドで再接続する
+    - deliver() が続けて失敗するとブレーカーが開き、カメラが停止している間は
+      接続を試みずにすぐ CircuitOpenError になる（reset_timeout 秒ごとに1回だけ送信を試す）
+    """
+
+    def __init__(self, address=SERVER_MAC_ADDRESS, port=PORT, connect_timeout=5.0, send_timeout=3.0,
+                 ack_timeout=3.0, keepalive_interval=5.0, initial_backoff=0.5, max_backoff=30.0, jitter=0.3,
+                 breaker=None, transport=None):
+        self.transport = transport or RfcommTransport()
+        self.address = address
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.send_timeout = send_timeout
+        self.ack_timeout = ack_timeout
+        self.keepalive_interval = keepalive_interval
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.breaker = breaker or CircuitBreaker(f"{self.transport.name} {address}")
+
+        self.lock = threading.RLock()
+        self.sock = None
+        self.decoder = None
+        # 送信キューを使わない send() 用の送信元IDと連番
+        self.sender_id = new_sender_id()
+        self.direct_seq = 0
+        self.failures = 0
+        self.next_attempt = 0.0
+        self.last_activity = 0.0
+        self.running = False
+        self.thread = None
+        # 統計
+        self.connects = 0
+        self.sent = 0
+        self.acked = 0
+        self.send_errors = 0
+        self.last_error = None
+
+    @classmethod
+    def from_settings(cls, settings, on_breaker_change=None):
+        """設定（SETTINGS['bluetooth']）から生成
+
+        transport に "rfcomm"（既定）/ "tcp" / "loopback" を指定する。
+        接続先は address（RFCOMM の場合は mac_address でもよい）、port は省略時トランスポートの既定値。
+        """
+        transport = create_transport(settings.get('transport', 'rfcomm'))
+        address = settings.get('address')
+        if address is None:
+            if transport.name != 'rfcomm':
+                raise ValueError(f"{transport.name} の通知先には address を指定してください")
+            address = settings.get('mac_address', SERVER_MAC_ADDRESS)
+        return cls(
+            address=address,
+            port=settings.get('port', transport.default_port),
+            connect_timeout=settings.get('connect_timeout', 5.0),
+            send_timeout=settings.get('send_timeout', 3.0),
+            ack_timeout=settings.get('ack_timeout', 3.0),
+            keepalive_interval=settings.get('keepalive_interval', 5.0),
+            initial_backoff=settings.get('initial_backoff', 0.5),
+            max_backoff=settings.get('max_backoff', 30.0),
+            jitter=settings.get('jitter', 0.3),
+            breaker=CircuitBreaker.from_settings(f"{transport.name} {address}", settings.get('breaker', {}),
+                                                 on_state_change=on_breaker_change),
+            transport=transport,
+        )
+
+    @property
+    def mac_address(self):
+        """接続先のアドレス（RFCOMM 以外の場合はホスト名や名前）"""
+        return self.address
+
+    @property
+    def connected(self):
+        return self.sock is not None
+
+    def start(self):
+        """キープアライブ・再接続スレッドを起動"""
+        if self.running:
+            return
+        self.running = True
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._keepalive_loop, daemon=True)
+            self.thread.start()
+
+    def close(self):
+        """スレッドを止めて接続を閉じる"""
+        self.running = False
+        with self.lock:
+            self._disconnect(None)
 
-    sock.close()
+    def send(self, message):
+        """メッセージ（"[ステーション番号]UID" 形式）を1件送信して ACK を待つ"""
+        with self.lock:
+            self.direct_seq += 1
+            self.deliver([(self.direct_seq, time.time(), message)], self.sender_id)
+
+    def deliver(self, entries, sender_id):
+        """(seq, 追加時刻, メッセージ) のリストを1回の send でまとめて送り、累積ACKの seq を返す
+
+        sender_id は seq を採番した送信キューの送信元ID（受信側の重複判定に使われる）。
+
+        ブレーカーが開いている間は何もせずに CircuitOpenError を送出する。
+        """
+        data = bytearray()
+        for seq, queued_at, message in entries:
+            station, uid, tapped_at = _event_fields(message, queued_at)
+            encode_event(data, seq, sender_id, station, uid, tapped_at)
+        last_seq = entries[-1][0]
+        with self.lock:
+            self.breaker.check()
+            if self.breaker.state == HALF_OPEN:
+                # 復旧確認の1回は再接続の待ち時間に関係なく接続を試す
+                self.next_attempt = 0.0
+            try:
+                acked = self._deliver(data, last_seq)
+            except Exception:
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
+            self.sent += len(entries)
+            self.acked = acked
+            self.last_activity = time.monotonic()
+            return acked
+
+    def _deliver(self, data, last_seq):
+        """送信してACKを待つ（切断を検出した場合は1回だけ接続し直して再送）"""
+        for attempt in (1, 2):
+            sock = self._ensure_connected()
+            try:
+                sock.sendall(bytes(data))
+                acked = self._wait_ack(sock, last_seq)
+            except (OSError, ProtocolError) as e:
+                self.send_errors += 1
+                self._disconnect(e)
+                if attempt == 2:
+                    raise
+                logger.warning(f"カメラ送信エラー。再接続して再送します: {e}")
+                # 直前まで使えていた接続なので待たずに再接続する
+                self.next_attempt = 0.0
+                continue
+            return acked
+
+    def _wait_ack(self, sock, last_seq):
+        """last_seq 以上の累積ACKが届くまで待つ"""
+        deadline = time.monotonic() + self.ack_timeout
+        acked = None
+        while acked is None or acked < last_seq:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise AckTimeoutError(f"ACK待ちタイムアウト (seq {last_seq}, 受信済み {acked})")
+            sock.settimeout(remaining)
+            data = sock.recv(1024)
+            if not data:
+                raise ConnectionError("受信側が接続を閉じました")
+            for kind, seq, _, _, _, _ in self.decoder.feed(data):
+                if kind == FRAME_ACK:
+                    acked = seq if acked is None else max(acked, seq)
+        sock.settimeout(self.send_timeout)
+        return acked
+
+    def stats(self):
+        """接続と送信の統計"""
+        with self.lock:
+            return {
+                "connected": self.connected,
+                "connects": self.connects,
+                "sent": self.sent,
+                "acked": self.acked,
+                "send_errors": self.send_errors,
+                "failures": self.failures,
+                "last_error": self.last_error,
+                "breaker": self.breaker.stats(),
+            }
+
+    def _ensure_connected(self):
+        """接続が無ければ接続する（再接続の待ち時間中は SenderUnavailableError）"""
+        if self.sock is not None:
+            return self.sock
+        wait = self.next_attempt - time.monotonic()
+        if wait > 0:
+            raise SenderUnavailableError(f"カメラ再接続待ち（あと{wait:.1f}秒）: {self.last_error}")
+        started = time.monotonic()
+        try:
+            sock = self.transport.connect(self.address, self.port, self.connect_timeout)
+            sock.settimeout(self.send_timeout)
+        except OSError as e:
+            self._schedule_retry(e)
+            raise
+        self.sock = sock
+        self.decoder = FrameDecoder()
+        self.failures = 0
+        self.connects += 1
+        self.last_activity = time.monotonic()
+        logger.info(f"カメラ接続完了: {self.transport.name} {self.address} ({(self.last_activity - started) * 1000:.0f}ms)")
+        return sock
+
+    def _schedule_retry(self, error):
+        """次の接続までの待ち時間を決める"""
+        self.failures += 1
+        self.last_error = str(error)
+        delay = min(self.max_backoff, self.initial_backoff * 2 ** (self.failures - 1))
+        delay *= 1.0 + random.uniform(-self.jitter, self.jitter)
+        self.next_attempt = time.monotonic() + delay
+        logger.warning(f"カメラ接続失敗（{self.failures}回目）: {error}。{delay:.1f}秒後に再接続します")
+
+    def _disconnect(self, error):
+        if self.sock is None:
+            return
+        try:
+            self.sock.close()
+        except Exception:
+            pass
+        self.sock = None
+        if error is not None:
+            self.last_error = str(error)
+            logger.warning(f"カメラとの接続を切断しました: {error}")
+
+    def _keepalive_loop(self):
+        """キープアライブの送信と、切断中の再接続"""
+        while self.running:
+            time.sleep(min(1.0, self.keepalive_interval))
+            with self.lock:
+                if not self.running:
+                    break
+                now = time.monotonic()
+                try:
+                    if self.sock is None:
+                        # ブレーカーが開いている間は裏で再接続せず、deliver() の復旧確認に任せる
+                        if now >= self.next_attempt and self.breaker.state == CLOSED:
+                            self._ensure_connected()
+                    elif now - self.last_activity >= self.keepalive_interval:
+                        self.sock.sendall(KEEPALIVE_FRAME)
+                        self.last_activity = now
+                except OSError as e:
+                    if self.sock is not None:
+                        # キープアライブの失敗: すぐに再接続を試みる
+                        self._disconnect(e)
+                        self.next_attempt = 0.0
+                    else:
+                        # 送信が無くてもカメラの停止を検出してブレーカーに数える
+                        self.breaker.record_failure()
+                except Exception as e:
+                    logger.error(f"カメラキープアライブエラー: {e}")
+
+
+# 旧名（RFCOMM専用だった頃の名前）
+RfcommSender = CameraSender
+
+
+_sender = None
+_sender_lock = threading.Lock()
+
+
+def get_sender(settings=None):
+    """プロセス共通の送信オブジェクト（初回呼び出し時に settings から作成して起動）"""
+    global _sender
+    with _sender_lock:
+        if _sender is None:
+            _sender = CameraSender.from_settings(settings or {})
+            _sender.start()
+        return _sender
+
+
+def send_message(message):
+    """カメラにメッセージを送信する関数（接続は共通の CameraSender を使い回す）"""
+    get_sender().send(message)
+    print("Message sent.")
 
 # テスト用（直接実行時）
 if __name__ == "__main__":
     message = "UIDtest!"
     send_message(message)
+    get_sender().close()
@@ -0,0 +1,133 @@
+import os
+import logging
+
+from bluetooth_send2 import CameraSender, validate_message
+from outbound_queue import OutboundQueue, OutboundDrainer
+from device_presence import DevicePresence
+
+logger = logging.getLogger(__name__)
+
+
+class CameraDestination:
+    """通知先のカメラレコーダー1台分（接続・送信キュー・再送・存在確認をそれぞれ独立に持つ）"""
+
+    def __init__(self, name, sender, queue, drainer, presence, required=True):
+        self.name = name
+        self.sender = sender
+        self.queue = queue
+        self.drainer = drainer
+        self.presence = presence
+        # False の通知先は送信キューに積めなくてもタップの処理を失敗にしない
+        self.required = required
+
+    @property
+    def mac_address(self):
+        return self.sender.mac_address
+
+    def stats(self):
+        return {
+            "required": self.required,
+            "sender": self.sender.stats(),
+            "outbox": self.drainer.stats(),
+            "presence": self.presence.stats(),
+        }
+
+
+class CameraFanout:
+    """複数のカメラレコーダーへの同時通知
+
+    put() は通知をすべての通知先の送信キューに積むだけで、送信は通知先ごとの OutboundDrainer が
+    それぞれの接続で並行して行う。停止中や遅い通知先があっても、他の通知先への送信やタップの処理は待たされない。
+    """
+
+    def __init__(self, destinations):
+        self.destinations = destinations
+
+    @classmethod
+    def from_settings(cls, settings, base_dir, on_result=None, on_breaker_change=None):
+        """設定から通知先を作成
+
+        bluetooth.destinations に通知先のリスト（name, transport, address/mac_address, port, required, outbox_path と
+        bluetooth の各設定の上書き）を指定する。無い場合は bluetooth の設定で1台だけ作成する。
+        on_result(destination, ok, count, error) / on_breaker_change(destination, old, new) で状態を知らせる。
+        """
+        bluetooth_settings = settings.get('bluetooth', {})
+        outbox_settings = settings.get('outbox', {})
+        configs = bluetooth_settings.get('destinations')
+        if not configs:
+            # 1台だけの場合は従来の送信キューのファイルをそのまま使う
+            configs = [{'name': 'camera',
+                        'outbox_path': outbox_settings.get('path', os.path.join(base_dir, 'outbox.log'))}]
+
+        destinations = []
+        for config in configs:
+            name = config['name']
+            if any(destination.name == name for destination in destinations):
+                raise ValueError(f"通知先の名前が重複しています: {name}")
+            dest_settings = {key: value for key, value in bluetooth_settings.items() if key != 'destinations'}
+            dest_settings.update(config)
+            destination = cls._create_destination(name, dest_settings, outbox_settings, base_dir,
+                                                  on_result, on_breaker_change)
+            destinations.append(destination)
+            logger.info(f"通知先: {name} {destination.sender.transport.name} {destination.mac_address} "
+                        f"({'必須' if destination.required else '任意'}, 送信キュー {destination.queue.path})")
+        return cls(destinations)
+
+    @staticmethod
+    def _create_destination(name, settings, outbox_settings, base_dir, on_result, on_breaker_change):
+        sender = CameraSender.from_settings(settings)
+        path = settings.get('outbox_path', os.path.join(base_dir, f'outbox-{name}.log'))
+        queue = OutboundQueue.from_settings(dict(outbox_settings, path=path), path, validate=validate_message)
+        drainer = OutboundDrainer(
+            queue,
+            sender,
+            batch_size=outbox_settings.get('batch_size', 20),
+            retry_interval=outbox_settings.get('retry_interval', 1.0),
+        )
+        presence = DevicePresence.from_settings(
+            sender.address,
+            settings.get('presence', {}),
+            connected=lambda: sender.connected,
+            probe=lambda address, timeout: sender.transport.probe(address, sender.port, timeout))
+        destination = CameraDestination(name, sender, queue, drainer, presence,
+                                        required=settings.get('required', True))
+        # コールバックには通知先を付けて渡す
+        if on_result:
+            drainer.on_result = lambda ok, count, error: on_result(destination, ok, count, error)
+        if on_breaker_change:
+            sender.breaker.on_state_change = lambda old, new: on_breaker_change(destination, old, new)
+        return destination
+
+    def start(self):
+        """送信キューを復元し、各通知先の接続・送出・存在確認を開始"""
+        for destination in self.destinations:
+            destination.queue.open()
+            destination.sender.start()
+            destination.drainer.start()
+            destination.presence.start()
+
+    def stop(self):
+        for destination in self.destinations:
+            destination.drainer.stop()
+            destination.presence.stop()
+            destination.sender.close()
+            destination.queue.close()
+
+    def put(self, message):
+        """すべての通知先の送信キューに積む（必須の通知先がすべて受け付けたら True）"""
+        ok = True
+        for destination in self.destinations:
+            seq = destination.queue.put(message)
+            if seq is None and destination.required:
+                ok = False
+        return ok
+
+    def find(self, mac_address):
+        """MACアドレスから通知先を探す（無ければ None）"""
+        for destination in self.destinations:
+            if destination.mac_address.upper() == mac_address.upper():
+                return destination
+        return None
+
+    def stats(self):
+        return {destination.name: destination.stats() for destination in self.destinations}
@@ -0,0 +1,142 @@
+import random
+import re
+import struct
+import time
+
+# NFCステーション → カメラレコーダーの通信フォーマット
+#
+# フレーム = ヘッダ(4バイト) + 本体
+#   ヘッダ: マジック(0xA5) / 種別 / 本体の長さ (ビッグエンディアン uint16)
+#   EVENT     : seq(uint32) / 送信元ID(uint32) / ステーションID(uint16) / タップ時刻[UNIXミリ秒](uint64) / UID(UTF-8)
+#               送信元IDは送信キュー（送信側で seq を採番する単位）ごとの乱数で、seq はこの単位で増えていく
+#   ACK       : seq(uint32) … この seq 以下のイベントをすべて受け取った（累積ACK）
+#   KEEPALIVE : 本体なし
+# 1回の send に複数のフレームを詰めてよく、受信側は recv の区切りに関係なくフレーム単位で取り出す。
+
+MAGIC = 0xA5
+FRAME_EVENT = 0x01
+FRAME_ACK = 0x02
+FRAME_KEEPALIVE = 0x03
+
+HEADER = struct.Struct(">BBH")
+EVENT = struct.Struct(">IIHQ")
+ACK = struct.Struct(">I")
+
+# UIDは最大10バイト（16進20文字）。余裕を見て上限を設け、壊れたストリームを早めに検出する
+MAX_BODY = 128
+
+_LEGACY_MESSAGE = re.compile(r"^\[(\d+)\](.*)$")
+
+
+class ProtocolError(Exception):
+    """フレームとして解釈できないデータを受信した"""
+
+
+def new_sender_id():
+    """送信元IDを作成（0 は使わない）"""
+    return random.randint(1, 0xFFFFFFFF)
+
+
+def encode_event(out, seq, sender, station, uid, tapped_at=None):
+    """EVENTフレームを out（bytearray）の末尾に追加"""
+    uid_bytes = uid.encode('utf-8') if isinstance(uid, str) else bytes(uid)
+    if EVENT.size + len(uid_bytes) > MAX_BODY:
+        raise ValueError(f"UIDが長すぎます: {len(uid_bytes)}バイト")
+    ts_ms = int((tapped_at if tapped_at is not None else time.time()) * 1000)
+    out += HEADER.pack(MAGIC, FRAME_EVENT, EVENT.size + len(uid_bytes))
+    out += EVENT.pack(seq, sender, station, ts_ms)
+    out += uid_bytes
+    return out
+
+
+def encode_ack(out, seq):
+    """ACKフレームを out（bytearray）の末尾に追加"""
+    out += HEADER.pack(MAGIC, FRAME_ACK, ACK.size)
+    out += ACK.pack(seq)
+    return out
+
+
+KEEPALIVE_FRAME = HEADER.pack(MAGIC, FRAME_KEEPALIVE, 0)
+
+
+def parse_legacy_message(message):
+    """従来の "[ステーション番号]UID" 形式の文字列を (station, uid) に分解"""
+    match = _LEGACY_MESSAGE.match(message)
+    if match:
+        return int(match.group(1)), match.group(2)
+    return 0, message
+
+
+class FrameDecoder:
+    """ストリームからフレームを取り出すデコーダ
+
+    feed() で受け取ったデータを1つのバッファに溜め、ヘッダと本体はバッファ上の位置から直接
+    unpack する（フレームごとにバッファを切り出したり作り直したりしない）。
+    取り出し終えた分は feed() 1回につき1度だけまとめて捨てる。
+    戻り値は (種別, seq, 送信元ID, ステーションID, タップ時刻[秒], UID) のリスト。ACK の場合は seq 以外が None。
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.frames = 0
+        self.bytes = 0
+
+    def feed(self, data):
+        self.buffer += data
+        self.bytes += len(data)
+        buffer = self.buffer
+        end = len(buffer)
+        offset = 0
+        frames = []
+        with memoryview(buffer) as view:
+            while end - offset >= HEADER.size:
+                magic, kind, length = HEADER.unpack_from(buffer, offset)
+                if magic != MAGIC or length > MAX_BODY:
+                    raise ProtocolError(f"不正なフレームヘッダです: magic=0x{magic:02X} length={length}")
+                body = offset + HEADER.size
+                if end - body < length:
+                    break
+                if kind == FRAME_EVENT:
+                    if length < EVENT.size:
+                        raise ProtocolError(f"EVENTフレームが短すぎます: {length}バイト")
+                    seq, sender, station, ts_ms = EVENT.unpack_from(buffer, body)
+                    uid = str(view[body + EVENT.size:body + length], 'utf-8')
+                    frames.append((FRAME_EVENT, seq, sender, station, ts_ms / 1000.0, uid))
+                elif kind == FRAME_ACK:
+                    if length != ACK.size:
+                        raise ProtocolError(f"ACKフレームの長さが不正です: {length}バイト")
+                    frames.append((FRAME_ACK, ACK.unpack_from(buffer, body)[0], None, None, None, None))
+                elif kind != FRAME_KEEPALIVE:
+                    raise ProtocolError(f"不明なフレーム種別です: 0x{kind:02X}")
+                offset = body + length
+        if offset:
+            del buffer[:offset]
+        self.frames += len(frames)
+        return frames
+
+    @property
+    def pending(self):
+        """まだフレームになっていないバイト数"""
+        return len(self.buffer)
+
+
+class DuplicateFilter:
+    """再送されたイベントを読み飛ばす
+
+    送信側は ACK を受け取れなかったイベントを再送するため、同じイベントが2回届くことがある。
+    seq は送信元（送信キュー）ごとに増えていくので、送信元IDごとに最後に受け取った seq を覚えておき、
+    それ以下の seq を重複とみなす。ステーションIDは複数の機器で同じ値になりうるため使わない
+    （送信キューが作り直された場合は送信元IDも変わるので、seq が1に戻っても受け付ける）。
+    """
+
+    def __init__(self):
+        self.last = {}
+        self.duplicates = 0
+
+    def accept(self, sender, seq):
+        last = self.last.get(sender)
+        if last is not None and seq <= last:
+            self.duplicates += 1
+            return False
+        self.last[sender] = seq
+        return True
@@ -0,0 +1,223 @@
+import errno
+import selectors
+import time
+import logging
+
+from camera_protocol import FrameDecoder, DuplicateFilter, ProtocolError, encode_ack, FRAME_EVENT
+
+logger = logging.getLogger(__name__)
+
+# 同時接続数の上限（NFCステーションの台数より多めに）
+MAX_CLIENTS = 16
+# 何も受信しないまま経過したら切断する秒数（送信側は接続を張ったまま数秒ごとにキープアライブを送る）
+CLIENT_IDLE_TIMEOUT = 10.0
+
+
+def _would_block(error):
+    """ノンブロッキングのソケットで「今は読み書きできない」エラーか
+
+    PyBluez の RFCOMM ソケットは BlockingIOError ではなく、errno が EAGAIN の
+    bluetooth.BluetoothError（OSError のサブクラス）を送出するため errno で判定する
+    （古い PyBluez は errno を持たずメッセージだけなので、その場合は文字列で判定する）。
+    """
+    if isinstance(error, BlockingIOError) or error.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+        return True
+    return error.errno is None and "temporarily unavailable" in str(error).lower()
+
+
+class ClientConnection:
+    """接続中のNFCステーション1台分の受信バッファと統計"""
+
+    def __init__(self, sock, info):
+        self.sock = sock
+        self.info = info
+        self.decoder = FrameDecoder()
+        # 送りきれていないACK
+        self.outgoing = bytearray()
+        self.connected_at = time.monotonic()
+        self.last_seen = self.connected_at
+        self.events = 0
+        self.acks = 0
+
+    def stats(self):
+        return {
+            "client": str(self.info),
+            "connected_s": round(time.monotonic() - self.connected_at, 1),
+            "bytes": self.decoder.bytes,
+            "frames": self.decoder.frames,
+            "events": self.events,
+            "acks": self.acks,
+            "buffered": self.decoder.pending,
+        }
+
+
+class CameraReceiver:
+    """複数のNFCステーションからの通知を同時に受け付ける
+
+    1本のスレッドで selector を使い、接続ごとの受信バッファ（FrameDecoder）と統計を持つ。
+    1台の受信待ちが他の接続の処理を止めることはない。
+    待受ソケットは camera_transport のトランスポートが作ったものなら何でもよい。
+    受け取ったイベントは重複を除いて on_event(station, uid, tapped_at) に渡す。
+    """
+
+    def __init__(self, on_event, max_clients=MAX_CLIENTS, idle_timeout=CLIENT_IDLE_TIMEOUT):
+        self.on_event = on_event
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+        self.duplicate_filter = DuplicateFilter()
+        # ステーションID → そのIDで送ってきた送信元ID（ステーションIDの重複の検出用）
+        self.station_senders = {}
+        self.clients = {}
+        self.selector = None
+        # 統計
+        self.accepted = 0
+        self.refused = 0
+        # 何も送らずに閉じた接続（送信側の存在確認）
+        self.probes = 0
+        self.events = 0
+
+    def serve(self, server, should_continue):
+        """should_continue() が False になるまで server で受け付けて処理する"""
+        self.selector = selectors.DefaultSelector()
+        server.setblocking(False)
+        self.selector.register(server, selectors.EVENT_READ, None)
+        try:
+            while should_continue():
+                for key, mask in self.selector.select(timeout=1.0):
+                    client = key.data
+                    if client is None:
+                        self._accept(server)
+                        continue
+                    if mask & selectors.EVENT_READ:
+                        self._read(client)
+                    if mask & selectors.EVENT_WRITE and client.sock in self.clients:
+                        self._flush(client)
+                now = time.monotonic()
+                for client in list(self.clients.values()):
+                    if now - client.last_seen > self.idle_timeout:
+                        self._close(client, f"{self.idle_timeout:.0f}秒間受信なし")
+        finally:
+            for client in list(self.clients.values()):
+                self._close(client)
+            self.selector.close()
+            logger.info(f"受信統計: {self.stats()}")
+
+    def handle_frames(self, frames):
+        """受信したフレームを処理し、返すべき累積ACKの seq を返す（イベントが無ければ None）"""
+        ack = None
+        for kind, seq, sender, station, tapped_at, uid in frames:
+            if kind != FRAME_EVENT:
+                continue
+            self._check_station(station, sender)
+            # 重複の判定は送信元ごと（ステーションIDが重複していても別の送信元のイベントは失われない）
+            if self.duplicate_filter.accept(sender, seq):
+                self.events += 1
+                self.on_event(station, uid, tapped_at)
+            else:
+                logger.info(f"再送されたUIDを読み飛ばします: [{station}]{uid} (送信元 {sender:08x}, seq {seq})")
+            # 重複でも受け取ったことは返す（送信側が再送をやめられるように）
+            ack = seq if ack is None else max(ack, seq)
+        return ack
+
+    def _check_station(self, station, sender):
+        """同じステーションIDを複数の送信元が使っていれば警告する"""
+        senders = self.station_senders.setdefault(station, set())
+        if sender in senders:
+            return
+        senders.add(sender)
+        if len(senders) > 1:
+            logger.warning(f"ステーションID {station} を複数の送信元が使っています（{len(senders)}件目: {sender:08x}）。"
+                           f"各ステーションの settings.json の station_id を確認してください")
+
+    def stats(self):
+        return {
+            "clients": len(self.clients),
+            "accepted": self.accepted,
+            "refused": self.refused,
+            "probes": self.probes,
+            "events": self.events,
+            "duplicates": self.duplicate_filter.duplicates,
+        }
+
+    def _accept(self, server):
+        try:
+            client_sock, client_info = server.accept()
+        except OSError as e:
+            if not _would_block(e) and "timed out" not in str(e).lower():
+                logger.warning(f"接続受付エラー: {e}")
+            return
+        if len(self.clients) >= self.max_clients:
+            self.refused += 1
+            logger.warning(f"同時接続数の上限（{self.max_clients}）に達しているため切断します: {client_info}")
+            try:
+                client_sock.close()
+            except Exception:
+                pass
+            return
+        client_sock.setblocking(False)
+        client = ClientConnection(client_sock, client_info)
+        self.clients[client_sock] = client
+        self.selector.register(client_sock, selectors.EVENT_READ, client)
+        # 存在確認（接続してすぐ閉じる）と区別するため、接続として数えるのは最初の受信時
+        logger.debug(f"接続受付: {client_info}")
+
+    def _close(self, client, reason=None):
+        if self.clients.pop(client.sock, None) is None:
+            return
+        try:
+            self.selector.unregister(client.sock)
+        except (KeyError, ValueError):
+            pass
+        try:
+            client.sock.close()
+        except Exception:
+            pass
+        if client.decoder.bytes == 0 and reason is None:
+            # 何も送らずに閉じた存在確認の接続
+            self.probes += 1
+            logger.debug(f"存在確認の接続を閉じました: {client.info}")
+            return
+        if reason:
+            logger.warning(f"切断: {client.info} ({reason})")
+        logger.info(f"接続統計: {client.stats()} (接続中 {len(self.clients)}台)")
+
+    def _flush(self, client):
+        """溜まっているACKを送れるだけ送り、残りがあれば書き込み可能になるのを待つ"""
+        if client.outgoing:
+            try:
+                sent = client.sock.send(bytes(client.outgoing))
+                del client.outgoing[:sent]
+            except OSError as e:
+                if not _would_block(e):
+                    self._close(client, f"送信エラー: {e}")
+                    return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if client.outgoing else 0)
+        self.selector.modify(client.sock, events, client)
+
+    def _read(self, client):
+        try:
+            data = client.sock.recv(1024)
+        except OSError as e:
+            if not _would_block(e):
+                self._close(client, f"通信エラー: {e}")
+            return
+        if not data:
+            self._close(client)
+            return
+        if client.decoder.bytes == 0:
+            self.accepted += 1
+            logger.info(f"接続許可: {client.info} (接続中 {len(self.clients)}台)")
+        client.last_seen = time.monotonic()
+        try:
+            frames = client.decoder.feed(data)
+        except ProtocolError as e:
+            self._close(client, f"不正なデータを受信しました: {e}")
+            return
+        # recv の区切りに関係なくフレーム単位で取り出し、まとめて1つのACKを返す
+        ack_seq = self.handle_frames(frames)
+        if ack_seq is None:
+            return
+        client.events += sum(1 for frame in frames if frame[0] == FRAME_EVENT)
+        client.acks += 1
+        encode_ack(client.outgoing, ack_seq)
+        self._flush(client)
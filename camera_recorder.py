@@ -4,9 +4,13 @@ from datetime import datetime
 import os
 import threading
 import json
-import bluetooth
+import queue
+import argparse
 import logging
 
+from camera_receiver import CameraReceiver, MAX_CLIENTS
+from camera_transport import TRANSPORTS, create_transport
+
 # ログ設定
 logging.basicConfig(
     level=logging.INFO,
@@ -20,6 +24,14 @@ logger = logging.getLogger(__name__)
 
 os.environ["QT_QPA_PLATFORM"] = "xcb"
 
+# 受信に使うトランスポート（既定はBluetooth RFCOMM。有線LANのステーションは --transport tcp）
+parser = argparse.ArgumentParser(description="カメラ録画とNFCステーションからのUID受信")
+parser.add_argument('--transport', default='rfcomm', choices=TRANSPORTS)
+parser.add_argument('--host', default='', help="TCPの待受アドレス（省略時はすべてのアドレス）")
+parser.add_argument('--port', type=int, help="待受ポート（RFCOMMはチャネル。省略時はトランスポートの既定値）")
+args = parser.parse_args()
+transport = create_transport(args.transport)
+
 width, height = 640, 360
 fps = 20
 font = cv2.FONT_HERSHEY_SIMPLEX
@@ -36,26 +48,52 @@ def get_output_filename():
     now = datetime.now()
     return now.strftime("%Y-%m-%d_%H-%M-%S") + ".mp4"
 
-def save_uid_to_json(uid):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+def uid_record(uid, tapped_at=None):
+    """uid.json に追加する1件分"""
+    now = datetime.now()
     data = {
         "uid": uid,
-        "timestamp": timestamp,
-        "datetime": datetime.now().isoformat()
+        "timestamp": now.strftime("%Y-%m-%d %H:%M:%S"),
+        "datetime": now.isoformat()
     }
+    if tapped_at is not None:
+        data["tapped_at"] = datetime.fromtimestamp(tapped_at).isoformat()
+    return data
+
+def save_uid_to_json(records):
     filename = "uid.json"
     try:
         existing_data = []
         if os.path.exists(filename):
             with open(filename, 'r', encoding='utf-8') as f:
                 existing_data = json.load(f)
-        existing_data.append(data)
+        existing_data.extend(records)
         with open(filename, 'w', encoding='utf-8') as f:
             json.dump(existing_data, f, ensure_ascii=False, indent=2)
-        logger.info(f"UIDをJSONファイルに追加: {uid}")
+        logger.info(f"UIDをJSONファイルに追加: {', '.join(record['uid'] for record in records)}")
     except Exception as e:
         logger.error(f"JSONファイル保存エラー: {e}")
 
+# 受信したUIDの記録は専用スレッドでファイルに書く
+# （受信スレッドがディスク待ちで止まると、すべてのステーションへのACKが遅れるため）
+uid_queue = queue.Queue()
+
+def uid_writer():
+    """キューに溜まったUIDをまとめて uid.json に書き込む（None で終了）"""
+    running = True
+    while running:
+        records = [uid_queue.get()]
+        while True:
+            try:
+                records.append(uid_queue.get_nowait())
+            except queue.Empty:
+                break
+        if None in records:
+            running = False
+            records = [record for record in records if record is not None]
+        if records:
+            save_uid_to_json(records)
+
 def draw_timestamp(frame):
     timestamp = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
     text_size, _ = cv2.getTextSize(timestamp, font, 0.6, 1)
@@ -88,57 +126,35 @@ def mouse_callback(event, x, y, flags, param):
                 out = cv2.VideoWriter(filename, fourcc, fps, (width, height))
                 logger.info(f"保存ファイル: {filename}")
 
+def handle_uid(station, uid, tapped_at):
+    """受信したUIDを記録"""
+    global received_uid, uid_received_time
+    received_uid = f"[{station}]{uid}"
+    uid_received_time = time.time()
+    logger.info(f"UID受信: {received_uid} (タップから {(uid_received_time - tapped_at) * 1000:.0f}ms)")
+    uid_queue.put(uid_record(received_uid, tapped_at))
+
+# 複数のNFCステーションからの同時接続を受け付ける
+receiver = CameraReceiver(handle_uid)
+
 def bluetooth_server():
-    global received_uid, uid_received_time, server_sock, bluetooth_running
+    global server_sock
     
     try:
-        server_sock = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
-        server_sock.bind(("", 1))  # チャネル1で待受
-        server_sock.listen(1)
-        server_sock.settimeout(1.0)  # タイムアウト設定
-        logger.info("Bluetooth UID受信サーバ 起動中...")
-
-        while bluetooth_running:
-            try:
-                client_sock, client_info = server_sock.accept()
-                logger.info(f"接続許可: {client_info}")
-                
-                try:
-                    client_sock.settimeout(10.0)  # クライアントソケットのタイムアウト
-                    while bluetooth_running:
-                        data = client_sock.recv(1024)
-                        if not data:
-                            break
-                        received_uid = data.decode('utf-8').strip()
-                        uid_received_time = time.time()
-                        logger.info(f"UID受信: {received_uid}")
-                        save_uid_to_json(received_uid)
-                        
-                except bluetooth.btcommon.BluetoothError as e:
-                    logger.warning(f"Bluetooth通信エラー: {e}")
-                except Exception as e:
-                    logger.error(f"予期しないエラー: {e}")
-                finally:
-                    try:
-                        client_sock.close()
-                    except:
-                        pass
-                        
-            except bluetooth.btcommon.BluetoothError as e:
-                if "timed out" not in str(e).lower():
-                    logger.warning(f"Bluetooth接続エラー: {e}")
-            except Exception as e:
-                logger.error(f"予期しないBluetoothエラー: {e}")
+        port = args.port if args.port is not None else transport.default_port
+        server_sock = transport.listen(args.host, port, MAX_CLIENTS)
+        logger.info(f"UID受信サーバ 起動中... ({transport.name} {args.host or '*'}:{port})")
+        receiver.serve(server_sock, lambda: bluetooth_running)
                 
     except Exception as e:
-        logger.error(f"Bluetoothサーバー初期化エラー: {e}")
+        logger.error(f"UID受信サーバーエラー: {e}")
     finally:
         if server_sock:
             try:
                 server_sock.close()
             except:
                 pass
-        logger.info("Bluetoothサーバー終了")
+        logger.info("UID受信サーバー終了")
 
 def cleanup():
     """リソースのクリーンアップ"""
@@ -147,6 +163,10 @@ def cleanup():
     
     bluetooth_running = False
     
+    # 書き込み待ちのUIDを書き終えてから終了
+    uid_queue.put(None)
+    uid_writer_thread.join(5.0)
+    
     if server_sock:
         try:
             server_sock.close()
@@ -168,6 +188,9 @@ def cleanup():
     cv2.destroyAllWindows()
     logger.info("クリーンアップ完了")
 
+uid_writer_thread = threading.Thread(target=uid_writer, daemon=True)
+uid_writer_thread.start()
+
 # Bluetoothサーバースレッド開始
 bluetooth_thread = threading.Thread(target=bluetooth_server, daemon=True)
 bluetooth_thread.start()
@@ -0,0 +1,177 @@
+import queue
+import socket
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+TRANSPORTS = ("rfcomm", "tcp", "loopback")
+
+
+class RfcommTransport:
+    """Bluetooth RFCOMM（pybluez）"""
+
+    name = "rfcomm"
+    default_port = 1  # 通常RFCOMMのポートは1を使うことが多いです
+
+    def connect(self, address, port, timeout):
+        """address（MACアドレス）に接続したソケットを返す"""
+        import bluetooth
+        sock = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
+        try:
+            sock.settimeout(timeout)
+            sock.connect((address, port))
+        except Exception:
+            _close_quietly(sock)
+            raise
+        return sock
+
+    def listen(self, address, port, backlog):
+        """待受ソケットを返す（address は使わない。ローカルのアダプタで待ち受ける）"""
+        import bluetooth
+        sock = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
+        sock.bind(("", port))
+        sock.listen(backlog)
+        return sock
+
+    def probe(self, address, port, timeout):
+        """指定したMACアドレスの機器だけに名前要求を送って応答を確認（周辺機器の一斉検索はしない）"""
+        import bluetooth
+        return bluetooth.lookup_name(address, timeout=timeout) is not None
+
+
+class TcpTransport:
+    """有線・無線LANのTCP接続"""
+
+    name = "tcp"
+    default_port = 5000
+
+    def connect(self, address, port, timeout):
+        sock = socket.create_connection((address, port), timeout=timeout)
+        # 小さなフレームをまとめずにすぐ送る
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def listen(self, address, port, backlog):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((address or "", port))
+        sock.listen(backlog)
+        return sock
+
+    def probe(self, address, port, timeout):
+        """待受ポートに接続できるか（接続してすぐ閉じる）
+
+        何も送らずに閉じた接続は、受信側（CameraReceiver）で接続として数えず、ログにも残さない。
+        """
+        try:
+            socket.create_connection((address, port), timeout=timeout).close()
+        except OSError:
+            return False
+        return True
+
+
+class LoopbackListener:
+    """同じプロセス内の接続を受け付ける待受ソケット
+
+    接続要求ごとに socketpair を作り、片方を accept() で返す。
+    内部のソケットで accept 待ちを知らせるため、selector に登録して使える。
+    """
+
+    def __init__(self, name, backlog):
+        self.name = name
+        self.pending = queue.Queue(backlog)
+        self._reader, self._writer = socket.socketpair()
+
+    def fileno(self):
+        return self._reader.fileno()
+
+    def setblocking(self, flag):
+        self._reader.setblocking(flag)
+
+    def settimeout(self, timeout):
+        self._reader.settimeout(timeout)
+
+    def offer(self, sock):
+        try:
+            self.pending.put_nowait(sock)
+        except queue.Full:
+            raise ConnectionRefusedError(f"ループバック {self.name}: 接続待ちが上限に達しています")
+        self._writer.send(b"\0")
+
+    def accept(self):
+        self._reader.recv(1)
+        sock = self.pending.get_nowait()
+        return sock, f"loopback:{self.name}"
+
+    def close(self):
+        LoopbackTransport.unregister(self)
+        while not self.pending.empty():
+            _close_quietly(self.pending.get_nowait())
+        self._reader.close()
+        self._writer.close()
+
+
+class LoopbackTransport:
+    """同じプロセス内の送信側と受信側をつなぐ（実機なしの試験・負荷計測用）
+
+    address を名前として待受を登録し、connect() は socketpair で受信側とつなぐ。
+    """
+
+    name = "loopback"
+    default_port = 0
+
+    _listeners = {}
+    _lock = threading.Lock()
+
+    def connect(self, address, port, timeout):
+        with self._lock:
+            listener = self._listeners.get((address, port))
+        if listener is None:
+            raise ConnectionRefusedError(f"ループバック {address}:{port} は待ち受けていません")
+        local, remote = socket.socketpair()
+        try:
+            listener.offer(remote)
+        except Exception:
+            local.close()
+            remote.close()
+            raise
+        local.settimeout(timeout)
+        return local
+
+    def listen(self, address, port, backlog):
+        with self._lock:
+            if (address, port) in self._listeners:
+                raise OSError(f"ループバック {address}:{port} は使用中です")
+            listener = LoopbackListener(f"{address}:{port}", backlog)
+            self._listeners[(address, port)] = listener
+        return listener
+
+    def probe(self, address, port, timeout):
+        with self._lock:
+            return (address, port) in self._listeners
+
+    @classmethod
+    def unregister(cls, listener):
+        with cls._lock:
+            for key, value in list(cls._listeners.items()):
+                if value is listener:
+                    del cls._listeners[key]
+
+
+def create_transport(name):
+    """設定の transport（"rfcomm" / "tcp" / "loopback"）に応じたトランスポートを作成"""
+    if name == "rfcomm":
+        return RfcommTransport()
+    if name == "tcp":
+        return TcpTransport()
+    if name == "loopback":
+        return LoopbackTransport()
+    raise ValueError(f"不明なトランスポートです: {name} (選択肢: {', '.join(TRANSPORTS)})")
+
+
+def _close_quietly(sock):
+    try:
+        sock.close()
+    except Exception:
+        pass
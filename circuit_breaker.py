@@ -0,0 +1,140 @@
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ブレーカーの状態
+CLOSED = "closed"         # 通常どおり送信する
+OPEN = "open"             # 連続して失敗したため、送信せずにすぐ失敗させる
+HALF_OPEN = "half_open"   # 復旧確認のため1回だけ送信を試している
+
+
+class CircuitOpenError(Exception):
+    """ブレーカーが開いているため送信しなかった"""
+
+
+class CircuitBreaker:
+    """連続した失敗で送信を止めるサーキットブレーカー
+
+    failure_threshold 回続けて失敗すると OPEN になり、allow() は reset_timeout 秒の間 False を返す。
+    期限を過ぎると最初の allow() だけが True を返して HALF_OPEN になり、その1回の結果で
+    CLOSED（成功）または OPEN（失敗、再び reset_timeout 秒待つ）に戻る。
+    on_state_change(old, new) で状態の変化を呼び出し側に知らせる。
+    """
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=10.0, on_state_change=None,
+                 clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_state_change = on_state_change
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        # 統計
+        self.opens = 0
+        self.rejected = 0
+        self.probes = 0
+        self.total_open = 0.0
+
+    @classmethod
+    def from_settings(cls, name, settings, on_state_change=None):
+        """設定（SETTINGS['bluetooth']['breaker']）から生成"""
+        return cls(
+            name,
+            failure_threshold=settings.get('failure_threshold', 3),
+            reset_timeout=settings.get('reset_timeout', 10.0),
+            on_state_change=on_state_change,
+        )
+
+    def allow(self):
+        """送信してよいか（OPEN の間は False、期限後の最初の1回だけ HALF_OPEN で True）"""
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self.probes += 1
+                changed = self._set_state(HALF_OPEN)
+            else:
+                self.rejected += 1
+                return False
+        self._notify(changed)
+        return True
+
+    def check(self):
+        """allow() が False の場合は CircuitOpenError"""
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name}: 連続して失敗したため送信を停止中です"
+                                   f"（{self.remaining():.1f}秒後に再確認）")
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            changed = self._set_state(CLOSED)
+        self._notify(changed)
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            changed = None
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                changed = self._set_state(OPEN)
+        self._notify(changed)
+
+    def remaining(self):
+        """OPEN の場合、次に送信を試せるまでの秒数"""
+        with self.lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (self.clock() - self.opened_at))
+
+    def stats(self):
+        with self.lock:
+            total_open = self.total_open
+            if self.opened_at is not None:
+                total_open += self.clock() - self.opened_at
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "opens": self.opens,
+                "rejected": self.rejected,
+                "probes": self.probes,
+                "total_open_s": round(total_open, 1),
+            }
+
+    def _set_state(self, state):
+        """状態を変更し、変化があれば (旧, 新) を返す（ロック内で呼ぶ）"""
+        old = self.state
+        if old == state:
+            return None
+        now = self.clock()
+        if state == OPEN:
+            if old == CLOSED:
+                self.opens += 1
+                self.opened_at = now
+            else:
+                # HALF_OPEN からの再オープン: 開いていた時間は通算し、待ち時間だけやり直す
+                self.total_open += now - self.opened_at
+                self.opened_at = now
+        elif state == CLOSED and self.opened_at is not None:
+            self.total_open += now - self.opened_at
+            self.opened_at = None
+        self.state = state
+        return old, state
+
+    def _notify(self, changed):
+        if changed is None:
+            return
+        old, new = changed
+        if new == OPEN:
+            logger.warning(f"{self.name}: ブレーカーが開きました（{self.reset_timeout:g}秒間送信を停止）")
+        elif new == CLOSED:
+            logger.info(f"{self.name}: ブレーカーが閉じました（送信を再開）")
+        else:
+            logger.info(f"{self.name}: 復旧確認のため送信を1回試します")
+        if self.on_state_change:
+            self.on_state_change(old, new)
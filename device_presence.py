@@ -0,0 +1,120 @@
+import threading
+import time
+import logging
+
+from camera_transport import RfcommTransport
+
+logger = logging.getLogger(__name__)
+
+
+def probe_device(mac_address, timeout=3):
+    """指定したMACアドレスの機器だけに名前要求を送って応答を確認（周辺機器の一斉検索はしない）"""
+    transport = RfcommTransport()
+    return transport.probe(mac_address, transport.default_port, timeout)
+
+
+class DevicePresence:
+    """カメラ側の機器が近くにあるかどうかのキャッシュ
+
+    is_present() は記録済みの結果を返すだけなので、どのスレッドから何度呼んでもすぐに戻る。
+    結果はバックグラウンドのスレッドが interval 秒ごとに probe_device() で更新し、
+    ttl 秒より古くなった場合は呼び出し時に更新を前倒しする（結果が出るまでは古い値を返す）。
+    connected（例: 送信側の接続状態）が True を返す間は、確認するまでもなく「あり」とする。
+    probe(address, timeout=...) を差し替えると Bluetooth 以外の通知先も確認できる。
+    """
+
+    def __init__(self, mac_address, ttl=30.0, interval=10.0, probe_timeout=3, connected=None,
+                 probe=probe_device):
+        self.mac_address = mac_address
+        self.ttl = ttl
+        self.interval = interval
+        self.probe_timeout = probe_timeout
+        self.connected = connected
+        self.probe = probe
+
+        self.present = None          # None は未確認
+        self.checked_at = None
+        self.wakeup = threading.Event()
+        self.running = False
+        self.thread = None
+        # 統計
+        self.probes = 0
+        self.probe_errors = 0
+        self.last_probe_ms = None
+
+    @classmethod
+    def from_settings(cls, mac_address, settings, connected=None, probe=probe_device):
+        """設定（SETTINGS['bluetooth']['presence']）から生成"""
+        return cls(
+            mac_address,
+            ttl=settings.get('ttl', 30.0),
+            interval=settings.get('interval', 10.0),
+            probe_timeout=settings.get('probe_timeout', 3),
+            connected=connected,
+            probe=probe,
+        )
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._loop, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+
+    def is_present(self):
+        """機器があれば True、無ければ False、まだ確認していなければ None"""
+        if self.connected is not None and self.connected():
+            return True
+        if self.checked_at is None or time.monotonic() - self.checked_at > self.ttl:
+            self.wakeup.set()
+        return self.present
+
+    def age(self):
+        """最後に確認してからの秒数（未確認なら None）"""
+        if self.checked_at is None:
+            return None
+        return time.monotonic() - self.checked_at
+
+    def refresh(self):
+        """今すぐ確認して結果を返す"""
+        if self.connected is not None and self.connected():
+            present = True
+        else:
+            started = time.monotonic()
+            try:
+                present = bool(self.probe(self.mac_address, timeout=self.probe_timeout))
+            except Exception as e:
+                self.probe_errors += 1
+                logger.debug(f"Bluetoothデバイス確認エラー: {e}")
+                present = False
+            self.probes += 1
+            self.last_probe_ms = round((time.monotonic() - started) * 1000, 1)
+        if present != self.present:
+            if present:
+                logger.info(f"Bluetoothデバイスを確認しました: {self.mac_address}")
+            else:
+                logger.warning(f"Bluetoothデバイスが見つかりません: {self.mac_address}")
+        self.present = present
+        self.checked_at = time.monotonic()
+        return present
+
+    def stats(self):
+        age = self.age()
+        return {
+            "present": self.present,
+            "age_s": round(age, 1) if age is not None else None,
+            "probes": self.probes,
+            "probe_errors": self.probe_errors,
+            "last_probe_ms": self.last_probe_ms,
+        }
+
+    def _loop(self):
+        while self.running:
+            self.refresh()
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
@@ -1,6 +1,3 @@
-import board
-import busio
-from adafruit_pn532.i2c import PN532_I2C
 import socket
 import time
 import tkinter as tk
@@ -8,10 +5,21 @@ from tkinter import ttk
 import threading
 from datetime import datetime
 import time
-import bluetooth
 import logging
 import traceback
-from bluetooth_send2 import send_message
+import json
+import os
+from camera_fanout import CameraFanout
+from circuit_breaker import CircuitOpenError, OPEN, HALF_OPEN
+from device_presence import probe_device
+from tag_pipeline import TagPipeline, TagJob
+from reader_manager import ReaderManager
+from ndef_codec import TemplateCache
+from tag_writer import write_ndef, verify_write, rewrite_pages, check_fingerprint, VerifyResult
+from tag_session import TagSession, TagLostError
+from tag_capability import CapabilityCache
+from provisioned_index import ProvisionedIndex
+from url_codec import build_tag_url, url_settings
 
 # ログ設定
 logging.basicConfig(
@@ -24,13 +32,35 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def load_settings():
+    """設定ファイルを読み込む（存在しない場合は既定値で動作）"""
+    settings_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'settings.json')
+    try:
+        with open(settings_path, 'r', encoding='utf-8') as f:
+            settings = json.load(f)
+        logger.info("設定ファイル読み込み完了")
+        return settings
+    except FileNotFoundError:
+        logger.info("settings.jsonファイルが見つかりません。既定値を使用します")
+        return {}
+    except json.JSONDecodeError as e:
+        logger.error(f"設定ファイルのJSON形式が不正です: {e}")
+        return {}
+    except Exception as e:
+        logger.error(f"設定ファイル読み込みエラー: {e}")
+        logger.error(f"詳細エラー情報: {traceback.format_exc()}")
+        return {}
+
+# 設定を読み込み
+SETTINGS = load_settings()
+
 class NFCReaderGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("NFCリーダー")
         
-        # マシン番号の設定
-        self.machine_no = 1
+        # マシン番号の設定（リーダーごとの station_id が無い場合に使用）
+        self.machine_no = SETTINGS.get('station_id', 1)
         
         logger.info("NFCリーダーアプリケーション開始")
         
@@ -62,58 +92,84 @@ class NFCReaderGUI:
         
         # 読み取り状態
         self.is_reading = False
-        self.reading_thread = None
         self.clear_timer = None
         
-        # NFC関連の初期化
-        self.pn532 = None
-        self.i2c = None
-        self.nfc_initialized = False
+        # NFC関連の初期化（settings.json の readers で複数台のPN532を指定できる）
+        self.reader_manager = ReaderManager(SETTINGS)
+        # URL設定（url.encoding でUIDの短縮エンコードを選択）
+        try:
+            self.base_url, self.uid_encoding = url_settings(SETTINGS)
+        except ValueError as e:
+            logger.error(f"URL設定エラー: {e}。既定値を使用します")
+            self.base_url, self.uid_encoding = url_settings({})
+        logger.info(f"ベースURL: {self.base_url} エンコード: {self.uid_encoding}")
+        
+        # NDEFテンプレート（ベースURLごとに一度だけ組み立て、タップごとにUIDだけを差し替える）
+        self.ndef_templates = TemplateCache(self.base_url, self.uid_encoding,
+                                            fingerprint=SETTINGS.get('nfc', {}).get('fingerprint', True))
+        
+        # タグ種別（容量・対応コマンド）のキャッシュ
+        self.tag_capabilities = CapabilityCache()
+        
+        # 書き込み済みタグのインデックス（ベースURL変更時は自動で破棄）
+        # 記録はメモリ上で更新し、ファイルへの追記は通知ステージで行う（リーダーのロック中に書かない）
+        index_path = SETTINGS.get('nfc', {}).get(
+            'provisioned_index_path',
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'provisioned_index.json'))
+        self.provisioned_index = ProvisionedIndex.from_settings(SETTINGS.get('nfc', {}), index_path, self.base_url)
+        self.provisioned_index.flush()
+        
+        # 通知先のカメラレコーダー（bluetooth.destinations で複数台を指定できる）
+        # - 通知先ごとにBluetooth接続を1本張ったまま使い回し、切断時はバックグラウンドで再接続
+        # - 通知はディスク上の送信キューに積み、通知先ごとにバックグラウンドでまとめて送る
+        #   （カメラ側が停止していても通知は失われず、接続が戻った時点で順に送られる）
+        # - カメラが停止している間は送信を止めるサーキットブレーカー付き（bluetooth.breaker）
+        # - カメラ側の機器が近くにあるかはTTL付きキャッシュで確認（接続中は確認を省略）
+        self.cameras = CameraFanout.from_settings(
+            SETTINGS,
+            os.path.dirname(os.path.abspath(__file__)),
+            on_result=self.on_camera_send_result,
+            on_breaker_change=self.on_camera_breaker_change,
+        )
+        self.cameras.start()
+        
+        # 検出→書き込み→通知のパイプライン
+        pipeline_settings = SETTINGS.get('pipeline', {})
+        self.pipeline = TagPipeline(
+            self.process_tag,
+            self.notify_tag,
+            write_queue_size=pipeline_settings.get('write_queue_size', 4),
+            notify_queue_size=pipeline_settings.get('notify_queue_size', 16),
+            write_workers=len(self.reader_manager.stations),
+        )
         
         # NFC初期化（GUI作成後に実行）
         self.setup_nfc()
         
-        # 初期化が成功した場合のみ読み取り開始
-        if self.nfc_initialized:
-            self.start_reading()
-        else:
-            logger.warning("NFC初期化が失敗したため、読み取りを開始しません")
-            self.update_status("NFC初期化失敗 - アプリケーションを再起動してください", "error")
+        # 初期化に失敗したリーダーも読み取りループの中で自動復旧させる
+        self.start_reading()
+        if not self.nfc_initialized:
+            logger.warning("NFC初期化が失敗しました。自動復旧を試みます")
+            self.update_status("NFC初期化失敗 - 自動復旧を試みています...", "error")
+    
+    @property
+    def nfc_initialized(self):
+        """使用できるリーダーが1台以上あるか"""
+        return any(station.initialized for station in self.reader_manager.stations)
     
     def setup_nfc(self):
         """NFCリーダーの初期化"""
-        try:
-            logger.info("NFC初期化開始")
-            self.update_status("I2C初期化中...", "info")
-            self.i2c = busio.I2C(board.SCL, board.SDA)
-            logger.info("I2C初期化完了")
-            self.update_status("I2C初期化完了", "success")
-            
-            self.update_status("PN532初期化中...", "info")
-            self.pn532 = PN532_I2C(self.i2c, debug=False)
-            logger.info("PN532オブジェクト作成完了")
-            self.update_status("PN532オブジェクト作成完了", "success")
-            
-            self.update_status("ファームウェアバージョン取得中...", "info")
-            ic, ver, rev, support = self.pn532.firmware_version
-            logger.info(f"ファームウェアバージョン: {ver}.{rev}")
-            self.update_status(f"ファームウェアバージョン: {ver}.{rev}", "success")
-            
-            self.update_status("SAM設定中...", "info")
-            self.pn532.SAM_configuration()
-            logger.info("SAM設定完了")
-            self.update_status("SAM設定完了", "success")
-            
-            self.update_status(f"PN532初期化完了 (v{ver}.{rev})", "success")
+        logger.info("NFC初期化開始")
+        ready = self.reader_manager.setup_all(self.update_status)
+        total = len(self.reader_manager.stations)
+        if ready == total:
+            self.update_status(f"PN532初期化完了 ({ready}台)", "success")
             logger.info("NFC初期化完了")
-            self.nfc_initialized = True
-            
-        except Exception as e:
-            error_msg = f"NFC初期化エラー: {e}"
-            logger.error(error_msg)
-            logger.error(f"詳細エラー情報: {traceback.format_exc()}")
-            self.update_status(error_msg, "error")
-            self.nfc_initialized = False
+        elif ready > 0:
+            self.update_status(f"PN532初期化: {ready}/{total}台のみ使用可能", "warning")
+            logger.warning(f"一部のリーダーが初期化できませんでした: {ready}/{total}")
+        else:
+            logger.error("NFC初期化エラー: 使用できるリーダーがありません")
     
     def create_widgets(self):
         """GUI要素の作成"""
@@ -215,7 +271,7 @@ class NFCReaderGUI:
         self.uid_bytes_label.config(text="---")
         self.url_label.config(text="---")
         self.send_label.config(text="---", foreground="black")
-        self.bluetooth_label.config(text="未接続", foreground="red")
+        # 接続状態（bluetooth_label）はタップごとの表示ではないため消さない（ブレーカー・送信結果の通知で更新する）
         self.update_status("NFCタグをかざしてください...", "info")
     
     def schedule_clear_display(self):
@@ -230,16 +286,13 @@ class NFCReaderGUI:
     
     def start_reading(self):
         """読み取り開始"""
-        if not self.is_reading and self.nfc_initialized:
+        if not self.is_reading:
             self.is_reading = True
             self.start_button.config(state='disabled')
             self.stop_button.config(state='normal')
-            self.reading_thread = threading.Thread(target=self.reading_loop, daemon=True)
-            self.reading_thread.start()
+            self.pipeline.start()
+            self.reader_manager.start(self.on_tag_detected, self.update_status)
             self.update_status("読み取り開始", "success")
-        elif not self.nfc_initialized:
-            logger.error("NFCが初期化されていないため、読み取りを開始できません")
-            self.update_status("NFC初期化失敗 - 読み取りを開始できません", "error")
     
     def stop_reading(self):
         """読み取り停止"""
@@ -248,62 +301,40 @@ class NFCReaderGUI:
         self.stop_button.config(state='disabled')
         self.update_status("読み取り停止", "warning")
         
+        # パイプラインのワーカーは待機状態のまま残し、統計だけ出力する
+        logger.info(f"パイプライン統計: {self.pipeline.stats_snapshot()}")
+        self.reader_manager.stop()
+        logger.info(f"リーダー統計: {self.reader_manager.stats()}")
+        
         # タイマーをキャンセル
         if self.clear_timer:
             self.clear_timer.cancel()
             self.clear_timer = None
     
-    def reading_loop(self):
-        """読み取りループ"""
-        logger.info("読み取りループ開始")
-        while self.is_reading:
-            try:
-                # NFC初期化状態をチェック
-                if not self.nfc_initialized or self.pn532 is None:
-                    logger.error("NFCが初期化されていません")
-                    self.update_status("NFC初期化エラー - 読み取りを停止します", "error")
-                    self.stop_reading()
-                    break
-                
-                self.update_status("NFCタグをかざしてください...", "info")
-                
-                # NFCタグ読み取り
-                try:
-                    uid = self.pn532.read_passive_target(timeout=1)
-                except Exception as e:
-                    error_msg = f"NFC読み取りエラー: {e}"
-                    logger.error(error_msg)
-                    logger.error(f"詳細エラー情報: {traceback.format_exc()}")
-                    self.update_status(error_msg, "error")
-                    time.sleep(1)
-                    continue
-                
-                if uid is not None:
-                    logger.info(f"タグ検出: {uid.hex()}")
-                    self.update_status("タグ検出！処理開始...", "success")
-                    self.process_tag(uid)
-                    time.sleep(2)  # 次の読み取りまでの待機
-                else:
-                    time.sleep(0.1)  # 短い待機
-                    
-            except Exception as e:
-                error_msg = f"読み取りループエラー: {e}"
-                logger.error(error_msg)
-                logger.error(f"詳細エラー情報: {traceback.format_exc()}")
-                self.update_status(error_msg, "error")
-                time.sleep(1)
-        
-        logger.info("読み取りループ終了")
+    def on_tag_detected(self, station, uid, detect_time, target=1, selected=True):
+        """リーダーがタグを検出した（各リーダーのポーリングワーカーから呼ばれる）
+
+        書き込みステージが成功した場合に True を返す（失敗したタグはかざし直しで再処理される）。
+        """
+        self.update_status("タグ検出！処理開始...", "success")
+        self.pipeline.record_detect(detect_time)
+        job = TagJob(uid, station, target=target, selected=selected)
+        if not self.pipeline.submit(job):
+            return False
+        # 書き込みステージがリーダーを使い終わるまで次のポーリングを待つ
+        # （Bluetooth送信の完了は待たない）
+        job.reader_done.wait()
+        return bool(job.write_ok)
     
-    def process_tag(self, uid):
-        """タグ処理"""
+    def process_tag(self, job):
+        """タグ処理（パイプラインの書き込みステージ）"""
         try:
             logger.info("タグ処理開始")
             self.update_status("タグ処理開始...", "info")
             
             # UID情報の表示
-            uid_str = uid.hex()
-            uid_bytes = list(uid)
+            uid_str = job.uid_str
+            uid_bytes = list(job.uid)
             
             logger.info(f"UID: {uid_str}, バイト列: {uid_bytes}")
             self.uid_label.config(text=uid_str)
@@ -311,137 +342,272 @@ class NFCReaderGUI:
             self.update_status("UID情報表示完了", "success")
             
             # URL生成
-            url = f"https://akioka-sub.cloud/questionnaire/{uid_str}"
+            url = build_tag_url(self.base_url, job.uid, self.uid_encoding)
             logger.info(f"生成URL: {url}")
             self.url_label.config(text=url)
             self.update_status("URL生成完了", "success")
             
-            # NFCタグへの書き込み
-            self._write_to_nfc_tag(uid_str)
+            # 書き込みデータはテンプレートのUID部分だけを差し替えて生成
+            template = self.ndef_templates.get(job.uid)
+            data = template.render(job.uid)
             
-            # Bluetooth送信
-            self._send_via_bluetooth(uid_str)
+            # 同じ内容を書き込み・検証済みのタグは書き込みステージを省略
+            payload_hash = ProvisionedIndex.payload_hash(data)
+            if self.provisioned_index.is_provisioned(uid_str, payload_hash):
+                logger.info(f"書き込み済みのタグのため書き込みをスキップします: {uid_str}")
+                self.update_status("書き込み済み - 書き込みをスキップ", "success")
+                return True
             
-            # 5秒後に表示をクリアするタイマーを設定
-            self.schedule_clear_display()
-            logger.info("タグ処理完了")
+            # 検出時の選択を引き継いだ（同時検出の2枚目以降は選択し直した）1つのセッションで種別判定・確認・書き込みを行う
+            station = job.station
+            with station.lock:
+                with TagSession(station.pn532, uid=job.uid, selected=job.selected,
+                                target=job.target, max_targets=station.max_targets) as session:
+                    ok = self._provision_tag(session, template, data, payload_hash)
+                logger.info(f"タグセッション: {session.summary()}")
+            return ok
             
         except Exception as e:
             error_msg = f"タグ処理エラー: {e}"
             logger.error(error_msg)
             logger.error(f"詳細エラー情報: {traceback.format_exc()}")
             self.update_status(error_msg, "error")
+            return False
+    
+    def notify_tag(self, job):
+        """Bluetooth通知（パイプラインの通知ステージ）
+
+        書き込みに失敗したタップは通知しない（かざし直して成功したときだけカメラ側に記録される）。
+        """
+        try:
+            if not job.write_ok:
+                logger.info(f"書き込みに失敗したためカメラへの通知を省略します: {job.uid_str}")
+                self.schedule_clear_display()
+                return False
+            machine_no = job.station.station_id if job.station is not None else self.machine_no
+            # タップ時刻（検出時の単調時刻を壁時計に換算）もカメラ側に送る
+            tapped_at = time.time() - (time.monotonic() - job.detected_at)
+            result = self._send_via_bluetooth(job.uid_str, machine_no, tapped_at)
+            # 書き込みステージで記録した書き込み済みタグをファイルに追記
+            self.provisioned_index.flush()
+            
+            # 5秒後に表示をクリアするタイマーを設定
+            self.schedule_clear_display()
+            elapsed = time.monotonic() - job.detected_at
+            logger.info(f"タグ処理完了: {job.uid_str} 検出から {elapsed * 1000:.0f}ms")
+            return result
+        except Exception as e:
+            error_msg = f"通知処理エラー: {e}"
+            logger.error(error_msg)
+            logger.error(f"詳細エラー情報: {traceback.format_exc()}")
+            self.update_status(error_msg, "error")
+            return False
+    
+    def _provision_tag(self, session, template, data, payload_hash):
+        """タグ種別を確認し、必要な場合のみ書き込む"""
+        uid_str = session.uid.hex()
+        
+        # インデックスに無くてもタグ上のフィンガープリントが一致すれば書き込みを省略（READ1回のみ）
+        if template.use_fingerprint and self._check_tag_fingerprint(session, template.tlv):
+            logger.info(f"フィンガープリント一致のため書き込みをスキップします: {uid_str}")
+            self.update_status("書き込み済み - 書き込みをスキップ", "success")
+            self.provisioned_index.mark(uid_str, payload_hash)
+            return True
+        
+        # 書き込む場合だけタグ種別と容量を確認（UIDごとにキャッシュ）。容量を超える場合は書き込み前に中止
+        capability = self.tag_capabilities.detect(session)
+        if len(data) > capability.capacity:
+            error_msg = f"URLがタグ容量を超えています: {len(data)} > {capability.capacity} バイト ({capability.name})"
+            logger.error(error_msg)
+            self.update_status(error_msg, "error")
+            return False
+        
+        # NFCタグへの書き込み
+        ok = self._write_to_nfc_tag(session, data, capability)
+        if ok:
+            self.provisioned_index.mark(uid_str, payload_hash)
+        return ok
     
-    def _write_to_nfc_tag(self, uid_str):
+    def _check_tag_fingerprint(self, session, tlv):
+        """タグ上のURIの末尾とフィンガープリントをREAD1回で確認"""
+        try:
+            return check_fingerprint(session, tlv)
+        except Exception as e:
+            logger.debug(f"フィンガープリント確認エラー: {e}")
+            return False
+    
+    def _write_to_nfc_tag(self, session, data, capability):
         """NFCタグへの書き込み処理"""
         try:
             logger.info("NFCタグ書き込み開始")
             self.update_status("NFCタグ書き込み中...", "info")
-            self.write_to_tag(uid_str)
+            result = self.write_to_tag(session, data, capability)
+            if result is None:
+                return False
             logger.info("NFCタグ書き込み完了")
-            self.update_status("NFCタグ書き込み完了", "success")
+            self.update_status(f"NFCタグ書き込み完了 ({result.written}ページ書込 / {result.skipped}ページ省略)", "success")
+            return True
+        except TagLostError as e:
+            logger.warning(f"NFCタグ書き込み中断: {e}")
+            self.update_status("タグが離されました - もう一度かざしてください", "warning")
+            return False
         except Exception as e:
             error_msg = f"NFCタグ書き込みエラー: {e}"
             logger.warning(error_msg)
             logger.warning(f"詳細エラー情報: {traceback.format_exc()}")
             self.update_status(error_msg, "warning")
+            return False
     
-    def _send_via_bluetooth(self, uid_str):
+    def _send_via_bluetooth(self, uid_str, machine_no=None, tapped_at=None):
         """Bluetooth送信処理"""
         try:
-            logger.info("Bluetooth送信開始")
-            self.update_status("Bluetooth送信開始...", "info")
-            self.send_to_camera(uid_str)
-            logger.info("Bluetooth送信完了")
-            self.update_status("Bluetooth送信完了", "success")
+            if not self.send_to_camera(uid_str, machine_no, tapped_at):
+                self.update_status("Bluetooth送信キュー登録失敗", "warning")
+                return False
+            self.update_status("Bluetooth送信キュー登録完了", "success")
+            return True
         except Exception as e:
             error_msg = f"Bluetooth送信エラー: {e}"
             logger.warning(error_msg)
             logger.warning(f"詳細エラー情報: {traceback.format_exc()}")
             self.update_status(error_msg, "warning")
+            return False
     
-    def write_to_tag(self, uid_str):
+    def write_to_tag(self, session, data, capability):
         """NFCタグへの書き込み"""
         try:
             # NFC初期化状態をチェック
-            if not self.nfc_initialized or self.pn532 is None:
+            if not self.nfc_initialized:
                 logger.error("NFCが初期化されていないため、タグ書き込みをスキップします")
                 return
             
-            url = f"https://akioka-sub.cloud/questionnaire/{uid_str}"
-            uri_body = url.replace("https://", "").encode('utf-8')
-            
-            ndef_record = b'\xD1\x01' + bytes([len(uri_body) + 1]) + b'\x55\x04' + uri_body
-            tlv = b'\x03' + bytes([len(ndef_record)]) + ndef_record + b'\xFE'
-            
-            data = list(tlv) + [0x00] * (144 - len(tlv))
-            
-            for i in range(0, len(data), 4):
-                page = 4 + i // 4
-                block = data[i:i+4]
-                if len(block) < 4:
-                    block += [0x00] * (4 - len(block))
-                self.pn532.ntag2xx_write_block(page, block)
+            # TLVが占めるページだけを書き込む（残留データの消去は設定で有効化）
+            # write_mode が delta の場合は現在の内容と異なるページだけを書き込む
+            nfc_settings = SETTINGS.get('nfc', {})
+            clear_stale = nfc_settings.get('clear_stale_pages', False)
+            delta = nfc_settings.get('write_mode', 'delta') == 'delta'
+            result = write_ndef(session, data, capacity=capability.capacity,
+                                clear_stale=clear_stale, delta=delta)
+            # 書き込んだページがある場合は一括で読み戻して検証し、不一致のページだけ1回書き直す
+            if result.written:
+                verify = verify_write(session, data, use_fast_read=capability.fast_read)
+                if verify.status == VerifyResult.MISMATCH:
+                    logger.warning(f"書き込み検証で不一致: ページ {verify.mismatched_pages}。再書き込みします")
+                    rewrite_pages(session, data, verify.mismatched_pages)
+                    verify = verify_write(session, data, use_fast_read=capability.fast_read)
+                result.verify = verify
+                logger.info(f"書き込み検証: {verify}")
+                if verify.status == VerifyResult.TAG_LOST:
+                    raise TagLostError("書き込み検証中にタグが離されました")
+                if not verify.ok:
+                    raise RuntimeError(f"書き込み検証に失敗しました: ページ {verify.mismatched_pages}")
+            logger.info(f"書き込み完了: {result.written} ページ書き込み, "
+                        f"{result.skipped} ページ変更なし, {result.cleared} ページ消去")
+            return result
             
         except Exception as e:
             logger.error(f"NFCタグ書き込みエラー: {e}")
             raise
     
     def check_bluetooth_device(self, mac_address):
-        """Bluetoothデバイスの状態を確認"""
+        """Bluetoothデバイスの状態を確認（カメラはバックグラウンドで確認済みの結果を返す）"""
         try:
+            destination = self.cameras.find(mac_address)
+            if destination is not None:
+                return bool(destination.presence.is_present())
+            # カメラ以外の機器はその機器だけに問い合わせる
             logger.info(f"Bluetoothデバイス確認中: {mac_address}")
-            
-            # デバイス検索
-            nearby_devices = bluetooth.discover_devices(lookup_names=True)
-            logger.info(f"発見されたデバイス数: {len(nearby_devices)}")
-            
-            for addr, name in nearby_devices:
-                logger.info(f"デバイス: {addr} - {name}")
-                if addr.upper() == mac_address.upper():
-                    logger.info(f"ターゲットデバイス発見: {name}")
-                    return True
-            
-            logger.warning(f"ターゲットデバイスが見つかりません: {mac_address}")
-            return False
+            return probe_device(mac_address)
             
         except Exception as e:
             logger.error(f"デバイス確認エラー: {e}")
             return False
 
-    def send_to_camera(self, uid_str):
-        """BluetoothでUIDを送信"""
+    def send_to_camera(self, uid_str, machine_no=None, tapped_at=None):
+        """UIDをカメラへの送信キューに登録（実際の送信は OutboundDrainer が行う）"""
         try:
-            # machine_noを[1]の形式で先頭に付与
-            message_to_send = f"[{self.machine_no}]{uid_str}"
-            logger.info(f"Bluetooth送信開始 - マシン番号付きUID: {message_to_send}")
-            self.send_label.config(text="Bluetooth接続中...", foreground="blue")
-            self.bluetooth_label.config(text="接続中...", foreground="orange")
+            # machine_noを[1]の形式でログに付与（送信時はフレームのステーションIDになる）
+            if machine_no is None:
+                machine_no = self.machine_no
+            message_to_send = f"[{machine_no}]{uid_str}"
+            # すべての通知先の送信キューに積む（送信は通知先ごとに並行して行われる）
+            accepted = self.cameras.put({
+                "station": int(machine_no),
+                "uid": uid_str,
+                "tapped_at": tapped_at if tapped_at is not None else time.time(),
+            })
+            if not accepted:
+                self.send_label.config(text="送信キュー満杯 - 通知を破棄しました", foreground="red")
+                return False
+            logger.info(f"Bluetooth送信キュー登録 - マシン番号付きUID: {message_to_send}")
             
-            # Bluetooth送信実行
-            send_message(message_to_send)
+            destinations = self.cameras.destinations
+            depth = max(destination.queue.depth() for destination in destinations)
+            if any(destination.queue.is_backpressured() for destination in destinations):
+                self.send_label.config(text=f"送信待ち {depth}件 - カメラとの接続を確認してください", foreground="red")
+            elif depth > 1 or not all(destination.sender.connected for destination in destinations):
+                self.send_label.config(text=f"送信待ち {depth}件", foreground="orange")
+            else:
+                self.send_label.config(text="Bluetooth送信中...", foreground="blue")
+            return True
             
-            # 成功時の表示更新
-            logger.info(f"Bluetooth送信完了 - マシン番号付きUID: {message_to_send}")
-            self.send_label.config(text="Bluetooth送信成功", foreground="green")
-            self.bluetooth_label.config(text="接続済み", foreground="green")
-            
-        except bluetooth.btcommon.BluetoothError as e:
-            error_msg = f"Bluetooth接続エラー: {e}"
-            logger.error(error_msg)
-            self.send_label.config(text=error_msg, foreground="red")
-            self.bluetooth_label.config(text="接続エラー", foreground="red")
         except Exception as e:
             error_msg = f"Bluetooth送信エラー: {e}"
             logger.error(error_msg)
             self.send_label.config(text=error_msg, foreground="red")
             self.bluetooth_label.config(text="送信エラー", foreground="red")
+            return False
+
+    def _camera_text(self, destination, text):
+        """通知先が複数ある場合は表示に通知先の名前を付ける"""
+        if len(self.cameras.destinations) > 1:
+            return f"{destination.name}: {text}"
+        return text
+    
+    def on_camera_send_result(self, destination, ok, count, error):
+        """送信キューの送出結果を表示に反映（通知先ごとの OutboundDrainer のスレッドから呼ばれる）"""
+        depth = destination.queue.depth()
+        # 任意の通知先の失敗は赤では表示しない
+        error_color = "red" if destination.required else "orange"
+        if ok:
+            logger.info(f"Bluetooth送信完了 ({destination.name}): {count}件 (未送信 {depth}件)")
+            if depth:
+                self.send_label.config(text=self._camera_text(destination, f"Bluetooth送信成功 (送信待ち {depth}件)"),
+                                       foreground="orange")
+            else:
+                self.send_label.config(text=self._camera_text(destination, "Bluetooth送信成功"), foreground="green")
+            self.bluetooth_label.config(text=self._camera_text(destination, "接続済み"), foreground="green")
+        elif isinstance(error, CircuitOpenError):
+            self.send_label.config(text=self._camera_text(destination, f"カメラ停止中 - 送信待ち {depth}件"),
+                                   foreground=error_color)
+        elif destination.presence.is_present() is False:
+            self.send_label.config(text=self._camera_text(destination, f"カメラが見つかりません - 送信待ち {depth}件"),
+                                   foreground=error_color)
+            self.bluetooth_label.config(text=self._camera_text(destination, "カメラ圏外"), foreground=error_color)
+        else:
+            self.send_label.config(text=self._camera_text(destination, f"Bluetooth接続エラー - 送信待ち {depth}件"),
+                                   foreground=error_color)
+            self.bluetooth_label.config(text=self._camera_text(destination, "接続エラー"), foreground=error_color)
+    
+    def on_camera_breaker_change(self, destination, old, new):
+        """ブレーカーの状態を接続状態の表示に反映（送信スレッドから呼ばれる）"""
+        if new == OPEN:
+            self.bluetooth_label.config(text=self._camera_text(destination, "カメラ停止中（送信保留）"),
+                                        foreground="red" if destination.required else "orange")
+        elif new == HALF_OPEN:
+            self.bluetooth_label.config(text=self._camera_text(destination, "再接続確認中..."), foreground="orange")
+        else:
+            self.bluetooth_label.config(text=self._camera_text(destination, "接続済み"), foreground="green")
 
 def main():
     logger.info("アプリケーション開始")
     root = tk.Tk()
     app = NFCReaderGUI(root)
     root.mainloop()
+    app.pipeline.stop()
+    app.provisioned_index.flush()
+    app.cameras.stop()
+    logger.info(f"カメラ通知統計: {app.cameras.stats()}")
     logger.info("アプリケーション終了")
 
 if __name__ == "__main__":
@@ -0,0 +1,321 @@
+import hashlib
+import threading
+
+from url_codec import encode_uid
+
+# NTAG2xxのユーザー領域はページ4から始まり、1ページは4バイト
+NDEF_START_PAGE = 4
+PAGE_SIZE = 4
+# NTAG213のユーザー領域サイズ
+DEFAULT_CAPACITY = 144
+
+TLV_NDEF = 0x03
+TLV_TERMINATOR = 0xFE
+
+# NDEF終端の直後に置くフィンガープリント（マジック2バイト＋ハッシュ6バイト）
+FINGERPRINT_MAGIC = b'FP'
+FINGERPRINT_SIZE = 8
+FINGERPRINT_PAGES = FINGERPRINT_SIZE // PAGE_SIZE
+
+# URIレコードの省略プレフィックス（長いものから順に判定する）
+URI_PREFIXES = [
+    ("https://www.", 0x02),
+    ("http://www.", 0x01),
+    ("https://", 0x04),
+    ("http://", 0x03),
+]
+
+
+def encode_uri_record(url):
+    """URLを単一のNDEF URIレコード（短縮形式）にエンコード"""
+    code = 0x00
+    body = url
+    for prefix, prefix_code in URI_PREFIXES:
+        if url.startswith(prefix):
+            code = prefix_code
+            body = url[len(prefix):]
+            break
+    payload = bytes([code]) + body.encode('utf-8')
+    if len(payload) > 0xFF:
+        raise ValueError(f"URIが長すぎます: {len(payload)} バイト")
+    # MB=1, ME=1, SR=1, TNF=0x01(Well-known) / Type長=1 / Type='U'
+    return b'\xD1\x01' + bytes([len(payload)]) + b'\x55' + payload
+
+
+def encode_tlv(message):
+    """NDEFメッセージをNDEF TLV＋終端TLVで包む"""
+    if len(message) < 0xFF:
+        header = bytes([TLV_NDEF, len(message)])
+    else:
+        header = bytes([TLV_NDEF, 0xFF, len(message) >> 8, len(message) & 0xFF])
+    return header + message + bytes([TLV_TERMINATOR])
+
+
+def build_uri_tlv(url):
+    """URLを書き込み用のTLVバイト列に変換"""
+    return encode_tlv(encode_uri_record(url))
+
+
+def page_count(length):
+    """length バイトを格納するのに必要なページ数"""
+    return (length + PAGE_SIZE - 1) // PAGE_SIZE
+
+
+def iter_pages(data, start_page=NDEF_START_PAGE):
+    """データをページ単位に分割して (ページ番号, 4バイト) を返す
+
+    ページ境界までのデータはコピーせず memoryview のスライスで返し、末尾の端数だけ0で埋める。
+    """
+    view = memoryview(data)
+    full = len(view) - len(view) % PAGE_SIZE
+    for offset in range(0, full, PAGE_SIZE):
+        yield start_page + offset // PAGE_SIZE, view[offset:offset + PAGE_SIZE]
+    if full < len(view):
+        block = bytes(view[full:]) + bytes(PAGE_SIZE - (len(view) - full))
+        yield start_page + full // PAGE_SIZE, block
+
+
+def fingerprint(tlv):
+    """TLVのフィンガープリント"""
+    return FINGERPRINT_MAGIC + hashlib.sha256(bytes(tlv)).digest()[:FINGERPRINT_SIZE - len(FINGERPRINT_MAGIC)]
+
+
+def fingerprint_page(tlv, start_page=NDEF_START_PAGE):
+    """フィンガープリントを置くページ（TLVの次のページ）"""
+    return start_page + page_count(len(tlv))
+
+
+def with_fingerprint(tlv):
+    """TLVをページ境界まで0埋めし、その後ろにフィンガープリントを付けたデータを返す
+
+    NDEFの読み取り側は終端TLV以降を無視するため、タグの動作には影響しない。
+    """
+    padding = bytes(page_count(len(tlv)) * PAGE_SIZE - len(tlv))
+    return bytes(tlv) + padding + fingerprint(tlv)
+
+
+def find_ndef_tlv(data):
+    """ユーザー領域のバイト列からNDEF TLVを探し、(メッセージ先頭オフセット, メッセージ長) を返す
+
+    NDEF TLVが見つからない、または長さフィールドが途中で切れている場合は None を返す。
+    """
+    index = 0
+    while index < len(data):
+        tag = data[index]
+        if tag == 0x00:
+            # NULL TLV
+            index += 1
+            continue
+        if tag == TLV_TERMINATOR or index + 1 >= len(data):
+            return None
+        length = data[index + 1]
+        header_len = 2
+        if length == 0xFF:
+            if index + 3 >= len(data):
+                return None
+            length = (data[index + 2] << 8) | data[index + 3]
+            header_len = 4
+        if tag == TLV_NDEF:
+            return index + header_len, length
+        index += header_len + length
+    return None
+
+
+def tlv_span(head):
+    """ユーザー領域先頭のバイト列から、既存のNDEF TLVが占めるバイト数（終端を含む）を求める
+
+    NDEF TLVが見つからない場合は0を返す。
+    """
+    found = find_ndef_tlv(head)
+    if found is None:
+        return 0
+    offset, length = found
+    return offset + length + 1
+
+
+class NdefTemplate:
+    """ベースURLごとに一度だけ組み立てるURI TLVのテンプレート
+
+    書き込みデータ全体（TLV＋ページ境界までの0埋め＋フィンガープリント）を
+    あらかじめ確保した bytearray に配置し、タップごとにUID部分とフィンガープリントだけを書き換える。
+    render() が返す memoryview はそのまま iter_pages() でページ単位に書き込める。
+    同じテンプレートを複数スレッドから同時に render() しないこと。
+    """
+
+    def __init__(self, base_url, encoding="hex", uid_length=7, fingerprint=True):
+        self.base_url = base_url
+        self.encoding = encoding
+        self.uid_length = uid_length
+        self.use_fingerprint = fingerprint
+        self.token_length = len(encode_uid(bytes(uid_length), encoding))
+
+        tlv = build_uri_tlv(base_url + "0" * self.token_length)
+        self.tlv_length = len(tlv)
+        # UIDはTLVの終端直前に入る
+        self.token_offset = self.tlv_length - 1 - self.token_length
+        size = page_count(self.tlv_length) * PAGE_SIZE
+        self.fingerprint_offset = size
+        if fingerprint:
+            size += FINGERPRINT_SIZE
+        self.buffer = bytearray(size)
+        self.buffer[:self.tlv_length] = tlv
+        self.view = memoryview(self.buffer)
+        self.tlv = self.view[:self.tlv_length]
+        if fingerprint:
+            self.buffer[self.fingerprint_offset:self.fingerprint_offset + len(FINGERPRINT_MAGIC)] = FINGERPRINT_MAGIC
+
+    def fits(self, uid):
+        """このテンプレートでUIDを差し替えられるか"""
+        return len(uid) == self.uid_length
+
+    def render(self, uid):
+        """UID部分を書き換えて書き込みデータ全体の memoryview を返す"""
+        token = encode_uid(uid, self.encoding).encode('ascii')
+        if len(token) != self.token_length:
+            raise ValueError(f"UIDの長さがテンプレートと一致しません: {len(uid)} バイト")
+        self.buffer[self.token_offset:self.token_offset + self.token_length] = token
+        if self.use_fingerprint:
+            digest = hashlib.sha256(self.tlv).digest()
+            start = self.fingerprint_offset + len(FINGERPRINT_MAGIC)
+            self.buffer[start:self.fingerprint_offset + FINGERPRINT_SIZE] = \
+                digest[:FINGERPRINT_SIZE - len(FINGERPRINT_MAGIC)]
+        return self.view
+
+    def pages(self, uid, start_page=NDEF_START_PAGE):
+        """UIDを差し替えて (ページ番号, 4バイトの memoryview) を返す"""
+        return iter_pages(self.render(uid), start_page)
+
+
+class TemplateCache:
+    """ベースURL・エンコード方式・UID長ごとのテンプレートを保持
+
+    テンプレートのバッファは共有できないため、スレッドごとに別のテンプレートを持つ。
+    """
+
+    def __init__(self, base_url, encoding="hex", fingerprint=True):
+        self.base_url = base_url
+        self.encoding = encoding
+        self.fingerprint = fingerprint
+        self.local = threading.local()
+
+    def get(self, uid):
+        """UID長に合ったテンプレート（スレッドごとに初回のみ組み立てる）"""
+        templates = getattr(self.local, 'templates', None)
+        if templates is None:
+            templates = self.local.templates = {}
+        template = templates.get(len(uid))
+        if template is None:
+            template = NdefTemplate(self.base_url, self.encoding, len(uid), self.fingerprint)
+            templates[len(uid)] = template
+        return template
+
+
+# --- 読み取り側: NDEFメッセージの解析 ---
+
+TNF_WELL_KNOWN = 0x01
+RTD_URI = b'U'
+RTD_TEXT = b'T'
+
+# URIレコードの識別コードとプレフィックス（NFC Forum URI RTD）
+URI_PREFIX_TABLE = {
+    0x00: "", 0x01: "http://www.", 0x02: "https://www.", 0x03: "http://", 0x04: "https://",
+    0x05: "tel:", 0x06: "mailto:", 0x07: "ftp://anonymous:anonymous@", 0x08: "ftp://ftp.",
+    0x09: "ftps://", 0x0A: "sftp://", 0x0B: "smb://", 0x0C: "nfs://", 0x0D: "ftp://",
+    0x0E: "dav://", 0x0F: "news:", 0x10: "telnet://", 0x11: "imap:", 0x12: "rtsp://",
+    0x13: "urn:", 0x14: "pop:", 0x15: "sip:", 0x16: "sips:", 0x17: "tftp:",
+    0x18: "btspp://", 0x19: "btl2cap://", 0x1A: "btgoep://", 0x1B: "tcpobex://",
+    0x1C: "irdaobex://", 0x1D: "file://", 0x1E: "urn:epc:id:", 0x1F: "urn:epc:tag:",
+    0x20: "urn:epc:pat:", 0x21: "urn:epc:raw:", 0x22: "urn:epc:", 0x23: "urn:nfc:",
+}
+
+
+class NdefRecord:
+    """NDEFレコード（type / id / payload は元データを参照する memoryview）"""
+
+    __slots__ = ("tnf", "type", "id", "payload", "mb", "me")
+
+    def __init__(self, tnf, record_type, record_id, payload, mb, me):
+        self.tnf = tnf
+        self.type = record_type
+        self.id = record_id
+        self.payload = payload
+        self.mb = mb
+        self.me = me
+
+    def is_uri(self):
+        return self.tnf == TNF_WELL_KNOWN and self.type == RTD_URI
+
+    def is_text(self):
+        return self.tnf == TNF_WELL_KNOWN and self.type == RTD_TEXT
+
+    def uri(self):
+        """URIレコードのURL文字列"""
+        prefix = URI_PREFIX_TABLE.get(self.payload[0], "")
+        return prefix + bytes(self.payload[1:]).decode('utf-8')
+
+    def text(self):
+        """Textレコードの (言語コード, 本文)"""
+        status = self.payload[0]
+        lang_len = status & 0x3F
+        lang = bytes(self.payload[1:1 + lang_len]).decode('ascii')
+        body = bytes(self.payload[1 + lang_len:])
+        if not status & 0x80:
+            return lang, body.decode('utf-8')
+        # UTF-16 はBOMが無ければビッグエンディアン（NFC Forum Text RTD）
+        if body[:2] in (b'\xfe\xff', b'\xff\xfe'):
+            return lang, body.decode('utf-16')
+        return lang, body.decode('utf-16-be')
+
+    def __repr__(self):
+        return f"NdefRecord(tnf={self.tnf}, type={bytes(self.type)!r}, payload_len={len(self.payload)})"
+
+
+def iter_records(message):
+    """NDEFメッセージのレコードを順に返す（ペイロードはコピーしない）"""
+    view = memoryview(message)
+    index = 0
+    while index < len(view):
+        flags = view[index]
+        mb = bool(flags & 0x80)
+        me = bool(flags & 0x40)
+        short_record = bool(flags & 0x10)
+        has_id = bool(flags & 0x08)
+        tnf = flags & 0x07
+        # ヘッダ（フラグ・タイプ長・ペイロード長・ID長）が途中で切れていないか
+        header_len = 2 + (1 if short_record else 4) + (1 if has_id else 0)
+        if index + header_len > len(view):
+            raise ValueError("NDEFレコードのヘッダが途中で切れています")
+        type_len = view[index + 1]
+        index += 2
+        if short_record:
+            payload_len = view[index]
+            index += 1
+        else:
+            payload_len = int.from_bytes(view[index:index + 4], 'big')
+            index += 4
+        id_len = 0
+        if has_id:
+            id_len = view[index]
+            index += 1
+        record_type = view[index:index + type_len]
+        index += type_len
+        record_id = view[index:index + id_len]
+        index += id_len
+        if index > len(view) or index + payload_len > len(view):
+            raise ValueError("NDEFレコードがメッセージ長を超えています")
+        payload = view[index:index + payload_len]
+        index += payload_len
+        yield NdefRecord(tnf, record_type, record_id, payload, mb, me)
+        if me:
+            break
+
+
+def parse_user_area(data):
+    """ユーザー領域のバイト列からNDEFレコードのリストを取り出す"""
+    found = find_ndef_tlv(data)
+    if found is None:
+        return []
+    offset, length = found
+    if offset + length > len(data):
+        raise ValueError("NDEF TLVが読み取り範囲を超えています")
+    return list(iter_records(memoryview(data)[offset:offset + length]))
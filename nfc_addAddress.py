@@ -1,11 +1,11 @@
-import board
-import busio
-from adafruit_pn532.i2c import PN532_I2C
+import argparse
 import time
 import json
 import sys
 import signal
 
+from pn532_hal import open_pn532
+
 # JSON保存ファイル名
 OUTPUT_FILE = "nfc_data.json"
 
@@ -52,10 +52,12 @@ if __name__ == "__main__":
     # Ctrl+C ハンドラ登録
     signal.signal(signal.SIGINT, signal_handler)
 
-    # I2C初期化
-    i2c = busio.I2C(board.SCL, board.SDA)
-    pn532 = PN532_I2C(i2c, debug=False)
-    pn532.SAM_configuration()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--simulate', action='store_true', help="実機の代わりにPN532シミュレータを使う")
+    args = parser.parse_args()
+
+    # PN532初期化（I2C、または --simulate の場合はシミュレータ）
+    pn532 = open_pn532({"reader_backend": "simulator"} if args.simulate else None)
 
     print("NFCリーダー初期化完了")
 
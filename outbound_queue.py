@@ -0,0 +1,336 @@
+import json
+import os
+import threading
+import time
+import logging
+import traceback
+from collections import deque
+
+from circuit_breaker import CircuitOpenError
+from camera_protocol import new_sender_id
+from tag_pipeline import StageStats
+
+logger = logging.getLogger(__name__)
+
+# 満杯時の方針
+DROP_OLDEST = "drop_oldest"   # 最も古い未送信メッセージを捨てて受け付ける
+REJECT_NEW = "reject_new"     # 新しいメッセージを受け付けない
+EVICTION_POLICIES = (DROP_OLDEST, REJECT_NEW)
+
+
+class OutboundQueue:
+    """ディスクに追記していく送信待ちキュー
+
+    put() したメッセージは連番（seq）付きでファイルに追記し、送信できたものは ack() で
+    「seq 以下は送信済み」という記録を追記する。起動時はファイルを先頭から読み直して
+    未送信のメッセージを復元するため、カメラ側が停止していてもアプリを再起動しても通知は失われない。
+    未送信は最大 max_entries 件までメモリとディスクに保持し、超えた場合は eviction の方針に従う。
+    max_age 秒を過ぎたメッセージは送信せずに破棄する。
+    送信済みの記録が compact_after 件たまったら、未送信分だけでファイルを書き直す。
+    validate（送れないメッセージで ValueError を送出する関数）を指定した場合、送れないメッセージは
+    受け付けずに「ファイル名.dead」に書き出す（キューの先頭で送信を止めないため）。
+    """
+
+    def __init__(self, path, max_entries=10000, max_age=24 * 3600, eviction=DROP_OLDEST,
+                 high_watermark=None, compact_after=1000, fsync=True, validate=None):
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f"不明な破棄方針です: {eviction} (選択肢: {', '.join(EVICTION_POLICIES)})")
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.eviction = eviction
+        # これを超えたら呼び出し側に送信の滞留を知らせる
+        self.high_watermark = high_watermark if high_watermark is not None else max_entries // 2
+        self.compact_after = compact_after
+        self.fsync = fsync
+        self.validate = validate
+        self.dead_letter_path = path + '.dead'
+
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        # (seq, 追加時刻[UNIX時刻], メッセージ)
+        self.pending = deque()
+        self.next_seq = 1
+        # seq を採番するこのキューの送信元ID（ファイルに保存し、キューを作り直した場合だけ変わる）
+        self.sender_id = None
+        self.dead_records = 0
+        self.file = None
+        # 統計
+        self.enqueued = 0
+        self.delivered = 0
+        self.evicted = 0
+        self.expired = 0
+        self.rejected = 0
+        self.invalid = 0
+
+    @classmethod
+    def from_settings(cls, settings, default_path, validate=None):
+        """設定（SETTINGS['outbox']）から生成"""
+        return cls(
+            settings.get('path', default_path),
+            max_entries=settings.get('max_entries', 10000),
+            max_age=settings.get('max_age', 24 * 3600),
+            eviction=settings.get('eviction', DROP_OLDEST),
+            high_watermark=settings.get('high_watermark'),
+            compact_after=settings.get('compact_after', 1000),
+            fsync=settings.get('fsync', True),
+            validate=validate,
+        )
+
+    def open(self):
+        """ファイルから未送信のメッセージを復元して追記を始める"""
+        with self.lock:
+            self._load()
+            self._compact()
+        if self.pending:
+            logger.info(f"未送信の通知を復元しました: {len(self.pending)}件 (seq {self.pending[0][0]}〜)")
+        return self
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def put(self, message):
+        """メッセージを追加して seq を返す（受け付けない場合は None）"""
+        with self.lock:
+            now = time.time()
+            if not self._check(now, message):
+                return None
+            self._expire(now)
+            if len(self.pending) >= self.max_entries:
+                if self.eviction == REJECT_NEW:
+                    self.rejected += 1
+                    logger.warning(f"送信キューが満杯のため通知を受け付けません: {message}")
+                    return None
+                seq, _, dropped = self.pending.popleft()
+                self.evicted += 1
+                self._append({"ack": seq})
+                logger.warning(f"送信キューが満杯のため最も古い通知を破棄しました: seq {seq} {dropped}")
+            seq = self.next_seq
+            self.next_seq += 1
+            self._append({"seq": seq, "ts": now, "message": message}, sync=self.fsync)
+            self.pending.append((seq, now, message))
+            self.enqueued += 1
+            self.not_empty.notify_all()
+            return seq
+
+    def peek_batch(self, max_count, timeout=None):
+        """先頭から最大 max_count 件を取り出さずに返す（空の場合は timeout 秒まで待つ）"""
+        with self.lock:
+            if not self.pending and timeout:
+                self.not_empty.wait(timeout)
+            self._expire(time.time())
+            return [self.pending[i] for i in range(min(max_count, len(self.pending)))]
+
+    def ack(self, seq):
+        """seq 以下のメッセージを送信済みにする"""
+        with self.lock:
+            count = 0
+            while self.pending and self.pending[0][0] <= seq:
+                self.pending.popleft()
+                count += 1
+            if not count:
+                return 0
+            self.delivered += count
+            self._append({"ack": seq})
+            if self.dead_records >= self.compact_after:
+                self._compact()
+            return count
+
+    def wake(self):
+        """待機中の peek_batch を起こす"""
+        with self.lock:
+            self.not_empty.notify_all()
+
+    def depth(self):
+        with self.lock:
+            return len(self.pending)
+
+    def oldest_age(self):
+        """最も古い未送信メッセージの経過秒数（空なら 0）"""
+        with self.lock:
+            return time.time() - self.pending[0][1] if self.pending else 0.0
+
+    def is_backpressured(self):
+        """未送信が high_watermark を超えているか"""
+        return self.depth() >= self.high_watermark
+
+    def stats(self):
+        with self.lock:
+            return {
+                "depth": len(self.pending),
+                "oldest_age_s": round(time.time() - self.pending[0][1], 1) if self.pending else 0.0,
+                "next_seq": self.next_seq,
+                "enqueued": self.enqueued,
+                "delivered": self.delivered,
+                "evicted": self.evicted,
+                "expired": self.expired,
+                "rejected": self.rejected,
+                "invalid": self.invalid,
+            }
+
+    def _check(self, queued_at, message):
+        """送れるメッセージか確認し、送れない場合は別ファイルに移す"""
+        if self.validate is None:
+            return True
+        try:
+            self.validate(message)
+            return True
+        except ValueError as e:
+            self.invalid += 1
+            logger.error(f"送信できない通知のため {self.dead_letter_path} に移します: {message} ({e})")
+            try:
+                with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({"ts": queued_at, "message": message, "error": str(e)},
+                                       ensure_ascii=False) + "\n")
+            except OSError as write_error:
+                logger.error(f"送信できない通知の書き出しエラー: {write_error}")
+            return False
+
+    def _expire(self, now):
+        """max_age を過ぎたメッセージを破棄"""
+        last = None
+        while self.pending and now - self.pending[0][1] > self.max_age:
+            last, _, message = self.pending.popleft()
+            self.expired += 1
+            logger.warning(f"保持期限を過ぎた通知を破棄しました: seq {last} {message}")
+        if last is not None:
+            self._append({"ack": last})
+
+    def _append(self, record, sync=False):
+        if self.file is None:
+            self.file = open(self.path, 'a', encoding='utf-8')
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        if sync:
+            os.fsync(self.file.fileno())
+        if "ack" in record:
+            self.dead_records += 1
+
+    def _load(self):
+        """ファイルを先頭から再生して未送信のメッセージを復元"""
+        self.pending.clear()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        acked = 0
+        entries = {}
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 書き込み途中で停止した最終行
+                logger.warning(f"送信キューの壊れた行を読み飛ばします: {line[:80]!r}")
+                continue
+            if "sender" in record:
+                self.sender_id = record["sender"]
+            elif "ack" in record:
+                acked = max(acked, record["ack"])
+            else:
+                entries[record["seq"]] = (record["seq"], record["ts"], record["message"])
+                self.next_seq = max(self.next_seq, record["seq"] + 1)
+        self.next_seq = max(self.next_seq, acked + 1)
+        # 以前に積まれた送れないメッセージは復元しない（open() の書き直しでファイルからも消える）
+        self.pending.extend(entries[seq] for seq in sorted(entries)
+                            if seq > acked and self._check(entries[seq][1], entries[seq][2]))
+
+    def _compact(self):
+        """未送信のメッセージだけでファイルを書き直す"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.sender_id is None:
+            self.sender_id = new_sender_id()
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({"sender": self.sender_id}) + "\n")
+                # 連番を引き継ぐため、最後に使った seq の送信済み記録を先頭に残す
+                f.write(json.dumps({"ack": self.next_seq - 1 if not self.pending else self.pending[0][0] - 1}) + "\n")
+                for seq, ts, message in self.pending:
+                    f.write(json.dumps({"seq": seq, "ts": ts, "message": message}, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self.dead_records = 0
+        except Exception as e:
+            logger.error(f"送信キューの書き直しエラー: {e}")
+            logger.error(f"詳細エラー情報: {traceback.format_exc()}")
+
+
+class OutboundDrainer:
+    """送信キューをバックグラウンドでまとめて送り出す
+
+    接続できている間は最大 batch_size 件ずつ sender.deliver() で送り、受信側の累積ACKまでを送信済みにする。
+    送信に失敗した場合は retry_interval 秒待って同じ先頭からやり直す（ACKの無いものは再送する）。
+    on_result(ok, count, error) で送信結果を呼び出し側に知らせる。
+    キューに入ってからACKを受け取るまでの時間を1件ごとに latency に記録する。
+    """
+
+    def __init__(self, queue, sender, batch_size=20, retry_interval=1.0, on_result=None):
+        self.queue = queue
+        self.sender = sender
+        self.batch_size = batch_size
+        self.retry_interval = retry_interval
+        self.on_result = on_result
+        self.latency = StageStats("delivery")
+        self.failures = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._loop, daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout=2.0):
+        self.running = False
+        self.queue.wake()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def _loop(self):
+        logger.info("送信キューの送出開始")
+        while self.running:
+            batch = self.queue.peek_batch(self.batch_size, timeout=1.0)
+            if not batch or not self.running:
+                continue
+            try:
+                acked = self.sender.deliver(batch, self.queue.sender_id)
+            except CircuitOpenError as e:
+                self.failures += 1
+                # カメラ停止中（ブレーカーが開いている）: 接続は試みていないので静かに待つ
+                logger.debug(f"送信保留中（未送信 {self.queue.depth()}件）: {e}")
+                if self.on_result:
+                    self.on_result(False, 0, e)
+                time.sleep(self.retry_interval)
+                continue
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"通知の送信に失敗しました（未送信 {self.queue.depth()}件）: {e}")
+                if self.on_result:
+                    self.on_result(False, 0, e)
+                time.sleep(self.retry_interval)
+                continue
+            count = self.queue.ack(acked)
+            now = time.time()
+            for seq, queued_at, _ in batch:
+                if seq <= acked:
+                    self.latency.record(now - queued_at)
+            if self.on_result:
+                self.on_result(True, count, None)
+        logger.info("送信キューの送出終了")
+
+    def stats(self):
+        """送信キューと送達時間の統計"""
+        snapshot = self.queue.stats()
+        snapshot["failures"] = self.failures
+        snapshot["delivery"] = self.latency.snapshot()
+        return snapshot
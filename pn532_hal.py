@@ -0,0 +1,89 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# PN532のI2Cアドレス（ハードウェア固定）
+PN532_I2C_ADDRESS = 0x24
+
+BACKENDS = ("pn532", "simulator")
+
+
+def create_i2c(bus=None):
+    """I2Cバスを作成（bus が None の場合はボード標準の SCL/SDA）"""
+    # ハードウェア用ライブラリは実機で使う場合だけ読み込む
+    if bus is None:
+        import board
+        import busio
+        return busio.I2C(board.SCL, board.SDA)
+    # 標準以外のバス（/dev/i2c-N）は adafruit-extended-bus が必要
+    from adafruit_extended_bus import ExtendedI2C
+    return ExtendedI2C(bus)
+
+
+class HardwareBackend:
+    """I2C接続の実機PN532（adafruit_pn532）"""
+
+    name = "pn532"
+
+    def __init__(self):
+        # バス番号 → I2Cオブジェクト（同じバスのリーダーで共有）
+        self.buses = {}
+
+    def open(self, bus=None, address=PN532_I2C_ADDRESS, on_status=None):
+        """PN532オブジェクトを作成（ファームウェア確認・SAM設定は呼び出し側で行う）"""
+        from adafruit_pn532.i2c import PN532_I2C
+        i2c = self.buses.get(bus)
+        if i2c is None:
+            if on_status:
+                on_status("I2C初期化中...", "info")
+            i2c = self.buses[bus] = create_i2c(bus)
+            logger.info(f"I2C初期化完了 (bus {bus})")
+        return PN532_I2C(i2c, address=address, debug=False)
+
+    def reset_bus(self, bus=None):
+        """I2Cバスを解放し、次の open() で作り直させる"""
+        i2c = self.buses.pop(bus, None)
+        if i2c is None:
+            return
+        try:
+            i2c.deinit()
+        except Exception as e:
+            logger.debug(f"I2Cバス解放エラー (bus {bus}): {e}")
+        logger.info(f"I2Cバスを解放しました (bus {bus})")
+
+
+class SimulatorBackend:
+    """ソフトウェアのPN532シミュレータ（pn532_sim）"""
+
+    name = "simulator"
+
+    def __init__(self, settings=None):
+        self.settings = settings or {}
+
+    def open(self, bus=None, address=PN532_I2C_ADDRESS, on_status=None):
+        """リーダーごとに独立したシミュレータを作成"""
+        from pn532_sim import simulator_from_settings
+        if on_status:
+            on_status("PN532シミュレータを使用します", "info")
+        logger.info(f"PN532シミュレータ作成 (bus {bus}, 0x{address:02X})")
+        return simulator_from_settings(self.settings)
+
+    def reset_bus(self, bus=None):
+        """シミュレータにはバスが無い"""
+
+
+def create_backend(settings):
+    """設定の reader_backend（"pn532" または "simulator"）に応じたバックエンドを作成"""
+    name = settings.get('reader_backend', 'pn532')
+    if name == "simulator":
+        return SimulatorBackend(settings.get('simulator', {}))
+    if name != "pn532":
+        raise ValueError(f"不明なリーダーバックエンドです: {name} (選択肢: {', '.join(BACKENDS)})")
+    return HardwareBackend()
+
+
+def open_pn532(settings=None, bus=None, address=PN532_I2C_ADDRESS):
+    """1台のPN532を開き、SAM設定まで済ませて返す（単体スクリプト用）"""
+    pn532 = create_backend(settings or {}).open(bus, address)
+    pn532.SAM_configuration()
+    return pn532
@@ -0,0 +1,467 @@
+import random
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# PN532コマンド
+GET_FIRMWARE_VERSION = 0x02
+SAM_CONFIGURATION = 0x14
+IN_DATA_EXCHANGE = 0x40
+IN_COMMUNICATE_THRU = 0x42
+IN_LIST_PASSIVE_TARGET = 0x4A
+IN_SELECT = 0x54
+
+# タグへのコマンド
+CMD_READ = 0x30
+CMD_WRITE = 0xA2
+CMD_FAST_READ = 0x3A
+CMD_GET_VERSION = 0x60
+
+# PN532のステータス（0x01: タグから応答なし）
+STATUS_OK = 0x00
+STATUS_TIMEOUT = 0x01
+
+# ファームウェアバージョン（実機 PN532 v1.6 と同じ）
+FIRMWARE_VERSION = (0x32, 1, 6, 0x07)
+
+# タグ種別 → (全ページ数, 最終ユーザーページ, CCのサイズバイト, GET_VERSION のストレージサイズ)
+TAG_TYPES = {
+    "NTAG213": (45, 39, 0x12, 0x0F),
+    "NTAG215": (135, 129, 0x3E, 0x11),
+    "NTAG216": (231, 225, 0x6D, 0x13),
+}
+
+
+class SimulatedTag:
+    """NTAG213/215/216 のメモリを模擬したタグ"""
+
+    def __init__(self, uid=None, tag_type="NTAG213", rng=None):
+        if tag_type not in TAG_TYPES:
+            raise ValueError(f"未対応のタグ種別です: {tag_type}")
+        self.tag_type = tag_type
+        self.pages, self.last_user_page, cc_size, self.storage_size = TAG_TYPES[tag_type]
+        if uid is None:
+            rng = rng or random
+            # NXP製造者コード 0x04 + ランダム6バイト
+            uid = bytes([0x04]) + bytes(rng.randrange(256) for _ in range(6))
+        self.uid = bytes(uid)
+        self.memory = bytearray(self.pages * 4)
+        uid = self.uid.ljust(7, b'\x00')
+        # ページ0〜2: UID と BCC、ページ3: Capability Container
+        self.memory[0:3] = uid[0:3]
+        self.memory[3] = 0x88 ^ uid[0] ^ uid[1] ^ uid[2]
+        self.memory[4:8] = uid[3:7]
+        self.memory[8] = uid[3] ^ uid[4] ^ uid[5] ^ uid[6]
+        self.memory[9] = 0x48
+        self.memory[12:16] = bytes([0xE1, 0x10, cc_size, 0x00])
+        # 空のNDEFメッセージ
+        self.memory[16:20] = bytes([0x03, 0x00, 0xFE, 0x00])
+        self.writes = 0
+
+    def __repr__(self):
+        return f"SimulatedTag({self.tag_type}, uid={self.uid.hex()})"
+
+    def read(self, page):
+        """READ: 4ページ（16バイト）。最終ページを越えた分は先頭に折り返す"""
+        if page >= self.pages:
+            return None
+        return bytes(self.memory[(p % self.pages) * 4 + i] for p in range(page, page + 4) for i in range(4))
+
+    def fast_read(self, start_page, end_page):
+        """FAST_READ: start_page〜end_page"""
+        if start_page > end_page or end_page >= self.pages:
+            return None
+        return bytes(self.memory[start_page * 4:(end_page + 1) * 4])
+
+    def write(self, page, data):
+        """WRITE: ユーザー領域の1ページ"""
+        if page < 4 or page > self.last_user_page or len(data) < 4:
+            return False
+        self.memory[page * 4:page * 4 + 4] = data[:4]
+        self.writes += 1
+        return True
+
+    def version(self):
+        """GET_VERSION の応答"""
+        return bytes([0x00, 0x04, 0x04, 0x02, 0x01, 0x00, self.storage_size, 0x03])
+
+    def user_area(self):
+        """ユーザー領域の内容"""
+        return bytes(self.memory[16:(self.last_user_page + 1) * 4])
+
+
+class LatencyModel:
+    """コマンドごとの所要時間（秒）
+
+    既定値は nfc_reader.log の実測値から求めたもの:
+    36ページの書き込みで約550ms（1ページ約15.3ms）、タグ検出 約70ms、
+    ファームウェアバージョン取得・SAM設定 約17ms。
+    READ / FAST_READ / GET_VERSION はログに無いため、1往復分の推定値。
+    scale で全体を伸縮し（0 で待ち時間なし）、jitter で ±割合のばらつきを加える。
+    """
+
+    def __init__(self, detect=0.070, detect_extra=0.020, read=0.008, write_page=0.0153, fast_read=0.006,
+                 fast_read_page=0.0004, get_version=0.006, select=0.005, tag_timeout=0.020,
+                 firmware=0.017, sam=0.017, scale=1.0, jitter=0.0, seed=None):
+        self.costs = {
+            "detect": detect,
+            # 2枚目以降のターゲットの衝突防止ループ
+            "detect_extra": detect_extra,
+            "read": read,
+            "write": write_page,
+            "fast_read": fast_read,
+            "fast_read_page": fast_read_page,
+            "get_version": get_version,
+            "select": select,
+            # タグから応答が無い場合にPN532がエラーを返すまでの時間
+            "tag_timeout": tag_timeout,
+            "firmware": firmware,
+            "sam": sam,
+        }
+        self.scale = scale
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+
+    @classmethod
+    def from_settings(cls, settings):
+        """設定（SETTINGS['simulator']['latency']）から生成"""
+        return cls(scale=settings.get('scale', 1.0), jitter=settings.get('jitter', 0.0),
+                   seed=settings.get('seed'), **{key: value for key, value in settings.items()
+                                                 if key not in ('scale', 'jitter', 'seed')})
+
+    def cost(self, name, count=1):
+        """コマンドの所要時間"""
+        cost = self.costs[name] * count * self.scale
+        if self.jitter:
+            cost *= 1.0 + self.rng.uniform(-self.jitter, self.jitter)
+        return max(cost, 0.0)
+
+
+class TagScript:
+    """タグの到着・取り去りの台本
+
+    arrive(at, tag) / remove(at, tag) で開始からの秒数ごとの出来事を並べる。
+    loop を指定すると、その周期で台本を繰り返す。
+    """
+
+    def __init__(self, loop=None):
+        self.events = []
+        self.loop = loop
+
+    def arrive(self, at, tag):
+        self.events.append((at, True, tag))
+        self.events.sort(key=lambda event: event[0])
+        return self
+
+    def remove(self, at, tag):
+        self.events.append((at, False, tag))
+        self.events.sort(key=lambda event: event[0])
+        return self
+
+    def field_at(self, elapsed):
+        """開始から elapsed 秒時点でリーダー上にあるタグ"""
+        if self.loop:
+            elapsed %= self.loop
+        field = []
+        for at, arrive, tag in self.events:
+            if at > elapsed:
+                break
+            if arrive and tag not in field:
+                field.append(tag)
+            elif not arrive and tag in field:
+                field.remove(tag)
+        return field
+
+
+class PeriodicArrivals:
+    """period 秒ごとに新しいUIDのタグが到着し、dwell 秒後に取り去られる台本
+
+    group を2以上にすると、同時に複数枚がかざされる。
+    """
+
+    def __init__(self, period=5.0, dwell=2.0, tag_type="NTAG213", group=1, start=1.0, seed=None):
+        self.period = period
+        self.dwell = dwell
+        self.tag_type = tag_type
+        self.group = group
+        self.start = start
+        self.seed = seed
+        self.tags = {}
+
+    def field_at(self, elapsed):
+        elapsed -= self.start
+        if elapsed < 0:
+            return []
+        cycle = int(elapsed // self.period)
+        if elapsed - cycle * self.period >= self.dwell:
+            return []
+        tags = self.tags.get(cycle)
+        if tags is None:
+            rng = random.Random(None if self.seed is None else f"{self.seed}-{cycle}")
+            tags = [SimulatedTag(tag_type=self.tag_type, rng=rng) for _ in range(self.group)]
+            # 取り去られたタグは保持しない
+            self.tags = {cycle: tags}
+        return list(tags)
+
+
+class SimulatedPN532:
+    """ソフトウェアだけで動くPN532
+
+    adafruit_pn532 の PN532_I2C と同じ firmware_version / SAM_configuration /
+    read_passive_target / mifare_classic_read_block / ntag2xx_read_block /
+    ntag2xx_write_block / call_function を提供するため、読み取り・書き込み処理を
+    変更せずに実行できる。call_function は InListPassiveTarget / InDataExchange
+    （READ・WRITE）/ InCommunicateThru（READ・FAST_READ・GET_VERSION）/ InSelect に対応する。
+    タグは台本（TagScript / PeriodicArrivals）か place() / remove() でリーダーに置く。
+    """
+
+    def __init__(self, script=None, latency=None, clock=time.monotonic, sleep=time.sleep, poll_step=0.005):
+        self.script = script
+        self.latency = latency or LatencyModel()
+        self.clock = clock
+        self.sleep = sleep
+        self.poll_step = poll_step
+        self.started = clock()
+        self.lock = threading.RLock()
+        # place() で置かれたタグ
+        self.placed = []
+        # InListPassiveTarget で活性化したターゲット（Tg 1 から）
+        self.targets = []
+        self.current = None
+        # NAK を返して HALT 状態になったタグ
+        self.halted = []
+        # コマンド名 → [回数, 合計秒]
+        self.command_stats = {}
+
+    # --- タグの配置 ---
+
+    def place(self, tag):
+        """タグをリーダーに置く"""
+        with self.lock:
+            if tag not in self.placed:
+                self.placed.append(tag)
+        return tag
+
+    def remove(self, tag):
+        """タグをリーダーから取り去る"""
+        with self.lock:
+            if tag in self.placed:
+                self.placed.remove(tag)
+
+    def field(self):
+        """現在リーダー上にあるタグ"""
+        with self.lock:
+            field = list(self.placed)
+        if self.script is not None:
+            field += [tag for tag in self.script.field_at(self.clock() - self.started) if tag not in field]
+        return field
+
+    # --- PN532_I2C 互換の高レベルAPI ---
+
+    @property
+    def firmware_version(self):
+        response = self.call_function(GET_FIRMWARE_VERSION, response_length=4)
+        return tuple(response)
+
+    def SAM_configuration(self):
+        self.call_function(SAM_CONFIGURATION, params=[0x01, 0x14, 0x01])
+
+    def read_passive_target(self, card_baud=0x00, timeout=1):
+        response = self.call_function(IN_LIST_PASSIVE_TARGET, params=[0x01, card_baud],
+                                      response_length=19, timeout=timeout)
+        if response is None:
+            return None
+        return response[6:6 + response[5]]
+
+    def mifare_classic_read_block(self, block_number):
+        response = self.call_function(IN_DATA_EXCHANGE, params=[0x01, CMD_READ, block_number & 0xFF],
+                                      response_length=17)
+        if response[0] != STATUS_OK:
+            return None
+        return response[1:]
+
+    def ntag2xx_read_block(self, block_number):
+        block = self.mifare_classic_read_block(block_number)
+        if block is None:
+            return None
+        return block[0:4]
+
+    def ntag2xx_write_block(self, block_number, data):
+        if data is None or len(data) != 4:
+            raise ValueError("Data must be an array of 4 bytes!")
+        params = [0x01, CMD_WRITE, block_number & 0xFF] + list(data)
+        response = self.call_function(IN_DATA_EXCHANGE, params=params, response_length=1)
+        return response[0] == STATUS_OK
+
+    def call_function(self, command, response_length=0, params=(), timeout=1):
+        """PN532コマンドを実行し、応答（コマンドコードを除く）を返す"""
+        params = bytes(params)
+        handlers = {
+            GET_FIRMWARE_VERSION: self._firmware_version,
+            SAM_CONFIGURATION: self._sam_configuration,
+            IN_LIST_PASSIVE_TARGET: self._list_passive_target,
+            IN_DATA_EXCHANGE: self._data_exchange,
+            IN_COMMUNICATE_THRU: self._communicate_thru,
+            IN_SELECT: self._select,
+        }
+        handler = handlers.get(command)
+        if handler is None:
+            raise RuntimeError(f"シミュレータ未対応のコマンドです: 0x{command:02X}")
+        with self.lock:
+            started = self.clock()
+            response = handler(params, timeout)
+            stats = self.command_stats.setdefault(f"0x{command:02X}", [0, 0.0])
+            stats[0] += 1
+            stats[1] += self.clock() - started
+        if response is None:
+            return None
+        return bytearray(response[:response_length]) if response_length else bytearray(response)
+
+    def stats(self):
+        """コマンドごとの回数と所要時間"""
+        with self.lock:
+            return {command: {"count": count, "total_ms": round(total * 1000, 1)}
+                    for command, (count, total) in self.command_stats.items()}
+
+    # --- コマンドの模擬 ---
+
+    def _spend(self, name, count=1):
+        cost = self.latency.cost(name, count)
+        if cost > 0:
+            self.sleep(cost)
+
+    def _target(self, number):
+        """活性化済みでリーダー上に残っているターゲット"""
+        if not 1 <= number <= len(self.targets):
+            return None
+        tag = self.targets[number - 1]
+        if tag in self.halted or tag not in self.field():
+            return None
+        return tag
+
+    def _nak(self, number):
+        """NAK を返したタグは HALT 状態になり、再選択するまで応答しない"""
+        tag = self.targets[number - 1]
+        if tag not in self.halted:
+            self.halted.append(tag)
+        return bytes([STATUS_TIMEOUT])
+
+    def _firmware_version(self, params, timeout):
+        self._spend("firmware")
+        return bytes(FIRMWARE_VERSION)
+
+    def _sam_configuration(self, params, timeout):
+        self._spend("sam")
+        return b''
+
+    def _list_passive_target(self, params, timeout):
+        max_targets = max(1, min(params[0] if params else 1, 2))
+        deadline = self.clock() + timeout
+        field = self.field()
+        while not field:
+            remaining = deadline - self.clock()
+            if remaining <= 0:
+                self.targets = []
+                self.current = None
+                return None
+            self.sleep(min(self.poll_step, remaining))
+            field = self.field()
+        targets = field[:max_targets]
+        self._spend("detect")
+        if len(targets) > 1:
+            self._spend("detect_extra", len(targets) - 1)
+        self.targets = targets
+        self.current = 1
+        self.halted = []
+        response = bytearray([len(targets)])
+        for number, tag in enumerate(targets, 1):
+            # Tg, SENS_RES, SEL_RES（Type 2 タグは 0x00）, UID長, UID
+            response += bytes([number, 0x00, 0x44, 0x00, len(tag.uid)]) + tag.uid
+        return bytes(response)
+
+    def _data_exchange(self, params, timeout):
+        number, command = params[0], params[1]
+        tag = self._target(number)
+        if tag is None:
+            self._spend("tag_timeout")
+            return bytes([STATUS_TIMEOUT])
+        self.current = number
+        if command == CMD_READ:
+            self._spend("read")
+            block = tag.read(params[2])
+            return self._nak(number) if block is None else bytes([STATUS_OK]) + block
+        if command == CMD_WRITE:
+            self._spend("write")
+            return bytes([STATUS_OK]) if tag.write(params[2], params[3:7]) else self._nak(number)
+        self._spend("tag_timeout")
+        return self._nak(number)
+
+    def _communicate_thru(self, params, timeout):
+        number = self.current or 0
+        tag = self._target(number)
+        if tag is None:
+            self._spend("tag_timeout")
+            return bytes([STATUS_TIMEOUT])
+        command = params[0]
+        if command == CMD_FAST_READ:
+            start_page, end_page = params[1], params[2]
+            self._spend("fast_read")
+            self._spend("fast_read_page", max(end_page - start_page + 1, 0))
+            data = tag.fast_read(start_page, end_page)
+        elif command == CMD_READ:
+            self._spend("read")
+            data = tag.read(params[1])
+        elif command == CMD_GET_VERSION:
+            self._spend("get_version")
+            data = tag.version()
+        else:
+            self._spend("tag_timeout")
+            data = None
+        return self._nak(number) if data is None else bytes([STATUS_OK]) + data
+
+    def _select(self, params, timeout):
+        number = params[0]
+        self._spend("select")
+        if 1 <= number <= len(self.targets):
+            tag = self.targets[number - 1]
+            if tag in self.field():
+                # 選択し直したタグは HALT 状態から戻る
+                if tag in self.halted:
+                    self.halted.remove(tag)
+                self.current = number
+                return bytes([STATUS_OK])
+        return bytes([STATUS_TIMEOUT])
+
+
+def simulator_from_settings(settings):
+    """設定（SETTINGS['simulator']）からシミュレータを生成
+
+    {"script": [{"at": 1.0, "arrive": "04a1...", "type": "NTAG215"}, {"at": 3.0, "remove": "04a1..."}],
+     "loop": 10.0, "latency": {"scale": 1.0, "jitter": 0.1}}
+    script が無い場合は period 秒ごとに新しいタグが dwell 秒間かざされる。
+    """
+    latency = LatencyModel.from_settings(settings.get('latency', {}))
+    events = settings.get('script')
+    if events:
+        script = TagScript(loop=settings.get('loop'))
+        tags = {}
+        for event in events:
+            uid = event.get('arrive') or event.get('remove')
+            tag = tags.get(uid)
+            if tag is None:
+                tag = tags[uid] = SimulatedTag(bytes.fromhex(uid), event.get('type', 'NTAG213'))
+            if 'arrive' in event:
+                script.arrive(event['at'], tag)
+            else:
+                script.remove(event['at'], tag)
+    else:
+        script = PeriodicArrivals(
+            period=settings.get('period', 5.0),
+            dwell=settings.get('dwell', 2.0),
+            tag_type=settings.get('tag_type', 'NTAG213'),
+            group=settings.get('group', 1),
+            seed=settings.get('seed'),
+        )
+    return SimulatedPN532(script, latency)
@@ -0,0 +1,89 @@
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PollScheduler:
+    """PN532ポーリングの間隔を利用状況に応じて調整するスケジューラ
+
+    タグを検出した直後は active_hold 秒間、短い間隔（active_interval）でポーリングし、
+    その後は空振りのたびに間隔を backoff_factor 倍して idle_interval まで伸ばす。
+    タイムアウトは常に短く保ち、待ち時間はスリープで取るため、
+    夜間などの待機中はI2C通信とCPU負荷が下がる。
+    """
+
+    def __init__(self, active_timeout=0.1, active_interval=0.02, idle_timeout=0.1, idle_interval=0.5,
+                 active_hold=10.0, backoff_factor=1.5, clock=time.monotonic):
+        self.active_timeout = active_timeout
+        self.active_interval = active_interval
+        self.idle_timeout = idle_timeout
+        self.idle_interval = idle_interval
+        self.active_hold = active_hold
+        self.backoff_factor = backoff_factor
+        self.clock = clock
+
+        self.interval = active_interval
+        self.timeout = active_timeout
+        self.last_activity = clock()
+        self.idle = False
+        self.polls = 0
+        self.detections = 0
+        # 実測ポーリングレート（指数移動平均）
+        self.rate = 0.0
+        self.last_poll = None
+
+    @classmethod
+    def from_settings(cls, settings):
+        """設定（SETTINGS['poll']）から生成"""
+        return cls(
+            active_timeout=settings.get('active_timeout', 0.1),
+            active_interval=settings.get('active_interval', 0.02),
+            idle_timeout=settings.get('idle_timeout', 0.1),
+            idle_interval=settings.get('idle_interval', 0.5),
+            active_hold=settings.get('active_hold', 10.0),
+            backoff_factor=settings.get('backoff_factor', 1.5),
+        )
+
+    def record(self, detected):
+        """ポーリング結果を記録し、次回の間隔を更新"""
+        now = self.clock()
+        self.polls += 1
+        if self.last_poll is not None:
+            period = now - self.last_poll
+            if period > 0:
+                self.rate = 0.8 * self.rate + 0.2 * (1.0 / period) if self.rate else 1.0 / period
+        self.last_poll = now
+
+        if detected:
+            self.detections += 1
+            self.last_activity = now
+            self.interval = self.active_interval
+            self.timeout = self.active_timeout
+            if self.idle:
+                self.idle = False
+                logger.info("ポーリング: アクティブ周期に復帰")
+            return
+
+        if now - self.last_activity < self.active_hold:
+            return
+        self.interval = min(self.idle_interval, max(self.interval, self.active_interval) * self.backoff_factor)
+        self.timeout = self.idle_timeout
+        if not self.idle and self.interval >= self.idle_interval:
+            self.idle = True
+            logger.info(f"ポーリング: 省電力周期に移行 (間隔 {self.interval:.2f}s)")
+
+    def poll_rate(self):
+        """現在の実測ポーリングレート（回/秒）"""
+        return self.rate
+
+    def stats(self):
+        """スケジューラの状態"""
+        return {
+            "mode": "idle" if self.idle else "active",
+            "interval_ms": round(self.interval * 1000, 1),
+            "timeout_ms": round(self.timeout * 1000, 1),
+            "poll_rate": round(self.rate, 2),
+            "polls": self.polls,
+            "detections": self.detections,
+        }
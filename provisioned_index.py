@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import threading
+import logging
+import traceback
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ProvisionedIndex:
+    """書き込み・検証済みのタグをUIDごとに記録する永続インデックス
+
+    UIDと書き込んだペイロードのハッシュが一致するタグは書き込みを省略できる。
+    ベースURLが変わった場合は起動時にインデックス全体を破棄する。
+
+    ファイルは1行1レコードの追記式（先頭行がベースURL、以降が {"uid", "hash"}、削除は hash が null）。
+    mark()/forget() はメモリ上の記録を更新するだけで、ディスクへの書き込みは flush() でまとめて行う
+    （リーダーのロックを持たない通知ステージから呼ぶ）。記録は max_entries 件までで、
+    超えた場合は最も長く使われていないUIDから捨てる。上書き・削除で不要になった行が
+    compact_after 行を超えたら、flush() で現在の記録だけのファイルに書き直す。
+    """
+
+    def __init__(self, path, base_url, max_entries=10000, compact_after=1000):
+        self.path = path
+        self.base_url = base_url
+        self.max_entries = max_entries
+        self.compact_after = compact_after
+        self.lock = threading.Lock()
+        # ファイルへの書き込みの直列化（self.lock はメモリ上の更新だけに使い、ディスク待ちで mark() を止めない）
+        self.file_lock = threading.Lock()
+        self.tags = OrderedDict()
+        # まだファイルに書いていないレコード
+        self.unflushed = []
+        self.dead_records = 0
+        self.needs_compact = False
+        self.load()
+
+    @classmethod
+    def from_settings(cls, settings, path, base_url):
+        """設定（SETTINGS['nfc']）から生成"""
+        return cls(
+            path,
+            base_url,
+            max_entries=settings.get('provisioned_index_max_entries', 10000),
+            compact_after=settings.get('provisioned_index_compact_after', 1000),
+        )
+
+    @staticmethod
+    def payload_hash(payload):
+        """ペイロードのハッシュ値"""
+        return hashlib.sha256(payload).hexdigest()[:16]
+
+    def load(self):
+        """ディスクからインデックスを読み込む"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except FileNotFoundError:
+            logger.info(f"書き込み済みインデックスが存在しないため新規作成します: {self.path}")
+            self.needs_compact = True
+            return
+        except OSError as e:
+            logger.warning(f"書き込み済みインデックスの読み込みエラー。破棄します: {e}")
+            self.needs_compact = True
+            return
+
+        base_url, records = self._parse(text)
+        if base_url != self.base_url:
+            logger.info(f"ベースURLが変更されたため書き込み済みインデックスを破棄します: "
+                        f"{base_url} -> {self.base_url}")
+            self.needs_compact = True
+            return
+        for uid_str, payload_hash in records:
+            self._apply(uid_str, payload_hash)
+        logger.info(f"書き込み済みインデックス読み込み完了: {len(self.tags)} 件")
+
+    def _parse(self, text):
+        """ファイルの内容を (ベースURL, [(UID, ハッシュ)]) にする"""
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            data = None
+        if isinstance(data, dict) and 'tags' in data:
+            # 以前の形式（全体を1つのJSONで保存）。次の flush() で追記式に書き直す
+            self.needs_compact = True
+            return data.get('base_url'), list(data['tags'].items())
+
+        base_url = None
+        records = []
+        for line in text.splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 書き込み途中で停止した最終行
+                logger.warning(f"書き込み済みインデックスの壊れた行を読み飛ばします: {line[:80]!r}")
+                continue
+            if 'base_url' in record:
+                base_url = record['base_url']
+            else:
+                records.append((record['uid'], record['hash']))
+        return base_url, records
+
+    def _apply(self, uid_str, payload_hash):
+        """記録を1件反映（上書き・削除・上限超えで不要になった行を数える）"""
+        if uid_str in self.tags:
+            del self.tags[uid_str]
+            self.dead_records += 1
+        if payload_hash is None:
+            self.dead_records += 1
+            return
+        self.tags[uid_str] = payload_hash
+        while len(self.tags) > self.max_entries:
+            self.tags.popitem(last=False)
+            self.dead_records += 1
+
+    def flush(self):
+        """まだ書いていない記録をファイルに追記（不要な行が多ければ書き直す）"""
+        with self.file_lock:
+            with self.lock:
+                records, self.unflushed = self.unflushed, []
+                snapshot = None
+                if self.needs_compact or self.dead_records >= self.compact_after:
+                    snapshot = list(self.tags.items())
+                    self.needs_compact = False
+                    self.dead_records = 0
+            try:
+                if snapshot is not None:
+                    self._compact(snapshot)
+                elif records:
+                    with open(self.path, 'a', encoding='utf-8') as f:
+                        f.writelines(json.dumps({"uid": uid_str, "hash": payload_hash}) + "\n"
+                                     for uid_str, payload_hash in records)
+            except Exception as e:
+                # 次の flush() で現在の記録からファイル全体を書き直す
+                with self.lock:
+                    self.needs_compact = True
+                logger.error(f"書き込み済みインデックス保存エラー: {e}")
+                logger.error(f"詳細エラー情報: {traceback.format_exc()}")
+
+    def _compact(self, snapshot):
+        """現在の記録だけでファイルを書き直す（一時ファイル経由で置き換える）"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({"base_url": self.base_url}, ensure_ascii=False) + "\n")
+            f.writelines(json.dumps({"uid": uid_str, "hash": payload_hash}) + "\n"
+                         for uid_str, payload_hash in snapshot)
+        os.replace(tmp_path, self.path)
+
+    def is_provisioned(self, uid_str, payload_hash):
+        """同じペイロードが書き込み済みか"""
+        with self.lock:
+            if self.tags.get(uid_str) != payload_hash:
+                return False
+            self.tags.move_to_end(uid_str)
+            return True
+
+    def mark(self, uid_str, payload_hash):
+        """書き込み・検証が成功したタグを記録（ディスクへは flush() で書く）"""
+        with self.lock:
+            if self.tags.get(uid_str) == payload_hash:
+                self.tags.move_to_end(uid_str)
+                return
+            self._apply(uid_str, payload_hash)
+            self.unflushed.append((uid_str, payload_hash))
+
+    def forget(self, uid_str):
+        """タグの記録を削除（ディスクへは flush() で書く）"""
+        with self.lock:
+            if uid_str not in self.tags:
+                return
+            self._apply(uid_str, None)
+            self.unflushed.append((uid_str, None))
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.tags), "unflushed": len(self.unflushed), "dead_records": self.dead_records}
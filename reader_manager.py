@@ -0,0 +1,380 @@
+import threading
+import time
+import logging
+import traceback
+
+from tag_presence import TagPresenceTracker
+from tag_session import PassiveTarget, list_passive_targets, MAX_TARGETS
+from pn532_hal import PN532_I2C_ADDRESS, create_backend
+from reader_recovery import ReaderRecovery, STEP_WAKEUP, STEP_BUS
+from reader_watchdog import WatchdogPN532, WorkerWatchdog, ReaderStallError
+from poll_scheduler import PollScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class ReaderStats:
+    """リーダーごとの処理数とエラー数"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.monotonic()
+        self.polls = 0
+        self.detections = 0
+        self.taps = 0
+        self.errors = 0
+        self.last_error = None
+        self.stalls = 0
+        self.last_stall = None
+
+    def record_poll(self, detected):
+        with self.lock:
+            self.polls += 1
+            if detected:
+                self.detections += 1
+
+    def record_tap(self):
+        with self.lock:
+            self.taps += 1
+
+    def record_error(self, error):
+        with self.lock:
+            self.errors += 1
+            self.last_error = str(error)
+
+    def record_stall(self, command, elapsed):
+        with self.lock:
+            self.stalls += 1
+            self.last_stall = f"{command} ({elapsed * 1000:.0f}ms)"
+
+    def snapshot(self):
+        with self.lock:
+            elapsed = max(time.monotonic() - self.started_at, 1e-6)
+            return {
+                "polls": self.polls,
+                "detections": self.detections,
+                "taps": self.taps,
+                "taps_per_min": round(self.taps * 60 / elapsed, 2),
+                "errors": self.errors,
+                "last_error": self.last_error,
+                "stalls": self.stalls,
+                "last_stall": self.last_stall,
+            }
+
+
+class ReaderStation:
+    """1台のPN532と、そのポーリングワーカー
+
+    検出したタグは on_tag(station, uid, detect_time, target, selected) で共有パイプラインへ渡す。
+    on_tag はこのリーダーの使用が終わるまで戻らないこと。戻り値が偽の場合（書き込みの失敗など）は
+    処理済みにせず、いったん取り去られてからかざし直されたときにもう一度処理する。
+    既定では従来どおり read_passive_target で1枚ずつ検出する。settings['nfc']['max_targets'] を2にした場合だけ
+    1回のポーリングで複数枚を検出し（InListPassiveTarget MaxTg=2）、同時にかざされたタグを順に処理する。
+    初期化に失敗した場合や読み取りエラーが続いた場合は、ポーリングワーカーが自動で復旧を試みる。
+    """
+
+    def __init__(self, station_id, backend, bus=None, address=PN532_I2C_ADDRESS, settings=None, bus_lock=None):
+        self.station_id = station_id
+        self.backend = backend
+        self.bus = bus
+        self.address = address
+        self.settings = settings or {}
+        # 連続でこの回数読み取りエラーになったら復旧処理に入る
+        self.error_threshold = self.settings.get('recovery', {}).get('error_threshold', 3)
+        self.recovery = ReaderRecovery.from_settings(self, self.settings.get('recovery', {}))
+        # 各コマンドの期限（コマンド自身のタイムアウトに加える余裕）
+        watchdog_settings = self.settings.get('watchdog', {})
+        self.watchdog_enabled = watchdog_settings.get('enabled', True)
+        self.command_margin = watchdog_settings.get('command_margin_ms', 500) / 1000
+        # 再初期化でバスのロックを待つ上限（固まったワーカーがロックを持ったままの場合に備える）
+        self.lock_timeout = watchdog_settings.get('lock_timeout_ms', 5000) / 1000
+        self.max_targets = min(self.settings.get('nfc', {}).get('max_targets', 1), MAX_TARGETS)
+        # 同じI2Cバス上のリーダーは1つのロックで排他する
+        self.lock = bus_lock or threading.RLock()
+        self.pn532 = None
+        self.initialized = False
+        self.running = False
+        self.thread = None
+        # ワーカーの世代（固まったワーカーを置き換えると増える）と最後の周回時刻
+        self.generation = 0
+        self.heartbeat = None
+        self.on_tag = None
+        self.on_status = None
+        self.scheduler = None
+        self.stats = ReaderStats()
+
+    @property
+    def name(self):
+        bus = "default" if self.bus is None else self.bus
+        return f"リーダー{self.station_id} (bus {bus}, 0x{self.address:02X})"
+
+    def setup(self, on_status=None):
+        """PN532を初期化してファームウェアバージョンを返す"""
+        def status(message, status_type="info"):
+            if on_status:
+                on_status(message, status_type)
+
+        with self.lock:
+            status(f"{self.name}: PN532初期化中...", "info")
+            self._replace_pn532(self.backend.open(self.bus, self.address, on_status))
+            logger.info(f"{self.name}: PN532オブジェクト作成完了")
+
+            status(f"{self.name}: ファームウェアバージョン取得中...", "info")
+            ic, ver, rev, support = self.pn532.firmware_version
+            logger.info(f"{self.name}: ファームウェアバージョン: {ver}.{rev}")
+
+            status(f"{self.name}: SAM設定中...", "info")
+            self.pn532.SAM_configuration()
+            logger.info(f"{self.name}: SAM設定完了")
+            self.initialized = True
+            return ver, rev
+
+    def reinitialize(self, step):
+        """復旧の1段階を実行（失敗時は例外）
+
+        固まった古いワーカーがバスのロックを持ったまま戻らない場合（backend.open() は
+        コマンドの期限監視の外で動く）、lock_timeout 秒で諦めて ReaderStallError にする。
+        復旧処理はこれを失敗した1段階として扱い、間隔を空けて再試行する。
+        """
+        started = time.monotonic()
+        if not self.lock.acquire(timeout=self.lock_timeout):
+            raise ReaderStallError("バスのロック", time.monotonic() - started)
+        try:
+            self.initialized = False
+            if step == STEP_BUS:
+                self.backend.reset_bus(self.bus)
+            if step in (STEP_WAKEUP, STEP_BUS) or self.pn532 is None:
+                self._replace_pn532(self.backend.open(self.bus, self.address))
+            ic, ver, rev, support = self.pn532.firmware_version
+            self.pn532.SAM_configuration()
+            self.initialized = True
+            logger.info(f"{self.name}: 再初期化完了 ({step}, ファームウェア {ver}.{rev})")
+        finally:
+            self.lock.release()
+
+    def _replace_pn532(self, pn532):
+        """PN532を差し替える（コマンドの期限監視が有効な場合はラップする）"""
+        if isinstance(self.pn532, WatchdogPN532):
+            self.pn532.close()
+        if self.watchdog_enabled:
+            pn532 = WatchdogPN532(pn532, margin=self.command_margin, on_stall=self._on_stall)
+        self.pn532 = pn532
+
+    def _on_stall(self, command, elapsed):
+        """コマンドが期限までに戻らなかった"""
+        self.stats.record_stall(command, elapsed)
+        if self.on_status:
+            self.on_status(f"{self.name}: リーダー応答なし ({command}) - 再初期化します", "error")
+
+    def current_command(self):
+        """実行中のPN532コマンド（分からない場合は None）"""
+        current = getattr(self.pn532, 'current', None) if isinstance(self.pn532, WatchdogPN532) else None
+        return current[0] if current else None
+
+    def start(self, on_tag, on_status=None):
+        """ポーリングワーカーを起動（未初期化のリーダーは復旧から始める）"""
+        if self.running:
+            return
+        self.running = True
+        self.on_tag = on_tag
+        self.on_status = on_status
+        self.heartbeat = time.monotonic()
+        if self.thread is not None and self.thread.is_alive():
+            # 停止要求後、まだループを抜けていないワーカーをそのまま継続させる
+            return
+        self._start_worker()
+
+    def _start_worker(self):
+        self.thread = threading.Thread(target=self._poll_loop, args=(self.on_tag, self.on_status, self.generation),
+                                       daemon=True)
+        self.thread.start()
+
+    def restart_worker(self, command, stalled):
+        """固まったポーリングワーカーを放棄し、リーダーを再初期化する新しいワーカーを起動"""
+        self.stats.record_stall(command, stalled)
+        if self.on_status:
+            self.on_status(f"{self.name}: 読み取りが停止しました ({command}) - 再起動します", "error")
+        self.initialized = False
+        self.generation += 1
+        self.heartbeat = time.monotonic()
+        self._start_worker()
+
+    def _alive(self, generation):
+        """ワーカーが動作を続けてよいか（周回ごとに呼び、生存を知らせる）"""
+        self.heartbeat = time.monotonic()
+        return self.running and generation == self.generation
+
+    def stop(self):
+        """ポーリングワーカーを停止（現在のポーリング終了後に抜ける）"""
+        self.running = False
+
+    def snapshot(self):
+        """リーダーの統計"""
+        snapshot = self.stats.snapshot()
+        if self.scheduler is not None:
+            snapshot["poll"] = self.scheduler.stats()
+        snapshot["recovery"] = self.recovery.stats.snapshot()
+        return snapshot
+
+    def _poll_loop(self, on_tag, on_status, generation):
+        """読み取りループ（パイプラインの検出ステージ）"""
+        logger.info(f"{self.name}: 読み取りループ開始")
+        nfc_settings = self.settings.get('nfc', {})
+        # タップ直後は短い周期、待機が続くと省電力周期までポーリング間隔を伸ばす
+        self.scheduler = scheduler = PollScheduler.from_settings(self.settings.get('poll', {}))
+        # 同じタグはかざされている間と、取り去られてから suppress_ttl 秒間は再処理しない
+        presence = TagPresenceTracker(
+            removal_misses=nfc_settings.get('removal_misses', 2),
+            suppress_ttl=nfc_settings.get('suppress_ttl', 2.0),
+        )
+        # 連続した読み取りエラーの回数と、最初のエラーの時刻
+        errors = 0
+        down_since = None
+        while self._alive(generation):
+            try:
+                if not self.initialized:
+                    if not self.recovery.recover(lambda: self._alive(generation), on_status, down_since):
+                        break
+                    errors = 0
+                    down_since = None
+                    if on_status:
+                        on_status("NFCタグをかざしてください...", "info")
+
+                # NFCタグ読み取り
+                try:
+                    started = time.monotonic()
+                    with self.lock:
+                        targets = self._detect(scheduler.timeout)
+                    detect_time = time.monotonic() - started
+                    scheduler.record(bool(targets))
+                    self.stats.record_poll(bool(targets))
+                    errors = 0
+                    down_since = None
+                except Exception as e:
+                    error_msg = f"{self.name}: NFC読み取りエラー: {e}"
+                    logger.error(error_msg)
+                    logger.error(f"詳細エラー情報: {traceback.format_exc()}")
+                    self.stats.record_error(e)
+                    if on_status:
+                        on_status(error_msg, "error")
+                    errors += 1
+                    if down_since is None:
+                        down_since = started
+                    if isinstance(e, ReaderStallError) or errors >= self.error_threshold:
+                        # エラーが続く場合はバスかPN532が固まっているとみなして再初期化する
+                        self.initialized = False
+                    else:
+                        time.sleep(0.2)
+                    continue
+
+                new = presence.observe_all(target.uid for target in targets)
+                if not new:
+                    # タグなし、またはかざされたままの処理済みタグ
+                    time.sleep(scheduler.interval)
+                    continue
+
+                if len(targets) > 1:
+                    logger.info(f"{self.name}: 複数タグ検出: {[target.uid.hex() for target in targets]}")
+                for index, target in enumerate(target for target in targets if target.uid in new):
+                    logger.info(f"{self.name}: タグ検出: {target.uid.hex()} (Tg {target.number})")
+                    # 2枚目以降は前のタグの処理中にターゲット一覧が取り直されている可能性があるため、
+                    # セッション開始時に選択し直す
+                    self.stats.record_tap()
+                    if on_tag(self, target.uid, detect_time, target.number, index == 0):
+                        presence.mark_processed(target.uid)
+                    else:
+                        presence.mark_failed(target.uid)
+
+            except Exception as e:
+                error_msg = f"{self.name}: 読み取りループエラー: {e}"
+                logger.error(error_msg)
+                logger.error(f"詳細エラー情報: {traceback.format_exc()}")
+                self.stats.record_error(e)
+                if on_status:
+                    on_status(error_msg, "error")
+                time.sleep(1)
+
+        logger.info(f"{self.name}: 読み取りループ終了")
+
+    def _detect(self, timeout):
+        """1回のポーリングで検出したターゲットの一覧"""
+        if self.max_targets > 1:
+            return list_passive_targets(self.pn532, self.max_targets, timeout=timeout)
+        uid = self.pn532.read_passive_target(timeout=timeout)
+        if uid is None:
+            return []
+        return [PassiveTarget(1, bytes(uid))]
+
+
+class ReaderManager:
+    """複数のPN532を1プロセスで動かす
+
+    settings['readers'] に [{"station_id": 1, "bus": null, "address": 36}, ...] の形式で指定する。
+    指定が無い場合は標準バスの1台（station_id は settings['station_id'] または 1）とする。
+    station_id はカメラ側でステーションを区別する番号なので、重複している場合は起動しない。
+    settings['reader_backend'] を "simulator" にすると実機の代わりにシミュレータを使う。
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        configs = settings.get('readers')
+        if not configs:
+            if 'station_id' not in settings:
+                logger.warning("station_id が設定されていないため 1 を使用します。"
+                               "複数のステーションから同じカメラに通知する場合は settings.json で別々の値を指定してください")
+            configs = [{"station_id": settings.get('station_id', 1)}]
+        backend = create_backend(settings)
+        self.bus_locks = {}
+        self.stations = []
+        for config in configs:
+            bus = config.get('bus')
+            if bus not in self.bus_locks:
+                self.bus_locks[bus] = threading.RLock()
+            station_id = config.get('station_id', len(self.stations) + 1)
+            if any(station.station_id == station_id for station in self.stations):
+                raise ValueError(f"readers の station_id が重複しています: {station_id}")
+            self.stations.append(ReaderStation(
+                station_id,
+                backend,
+                bus=bus,
+                address=config.get('address', PN532_I2C_ADDRESS),
+                settings=settings,
+                bus_lock=self.bus_locks[bus],
+            ))
+        # 周回が止まったポーリングワーカーを検出して再起動する
+        self.watchdog = WorkerWatchdog(
+            self.stations, timeout=settings.get('watchdog', {}).get('worker_timeout_ms', 10000) / 1000)
+
+    def setup_all(self, on_status=None):
+        """全リーダーを初期化し、初期化できた台数を返す"""
+        ready = 0
+        for station in self.stations:
+            try:
+                ver, rev = station.setup(on_status)
+                if on_status:
+                    on_status(f"{station.name}: PN532初期化完了 (v{ver}.{rev})", "success")
+                ready += 1
+            except Exception as e:
+                error_msg = f"{station.name}: NFC初期化エラー: {e}"
+                logger.error(error_msg)
+                logger.error(f"詳細エラー情報: {traceback.format_exc()}")
+                station.stats.record_error(e)
+                if on_status:
+                    on_status(error_msg, "error")
+        return ready
+
+    def start(self, on_tag, on_status=None):
+        """全リーダーのポーリングを開始（初期化に失敗したリーダーは自動復旧を続ける）"""
+        for station in self.stations:
+            station.start(on_tag, on_status)
+        self.watchdog.start()
+
+    def stop(self):
+        """全リーダーのポーリングを停止"""
+        self.watchdog.stop()
+        for station in self.stations:
+            station.stop()
+
+    def stats(self):
+        """リーダーごとの統計"""
+        return {station.station_id: station.snapshot() for station in self.stations}
@@ -0,0 +1,127 @@
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 復旧の段階（軽いものから順に試す）
+STEP_SAM = "sam"          # ファームウェア確認とSAM設定のやり直し
+STEP_WAKEUP = "wakeup"    # PN532オブジェクトを作り直してウェイクアップ・再初期化
+STEP_BUS = "bus"          # I2Cバスを作り直してから再初期化
+RECOVERY_STEPS = (STEP_SAM, STEP_WAKEUP, STEP_BUS)
+
+
+class RecoveryStats:
+    """停止から復旧までの時間の記録"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.outages = 0
+        self.recoveries = 0
+        self.attempts = 0
+        self.steps = {step: 0 for step in RECOVERY_STEPS}
+        self.last_step = None
+        self.last_ttr = None
+        self.max_ttr = 0.0
+        self.total_down = 0.0
+
+    def record_attempt(self):
+        with self.lock:
+            self.attempts += 1
+
+    def record_outage(self):
+        with self.lock:
+            self.outages += 1
+
+    def record_recovery(self, step, ttr):
+        with self.lock:
+            self.recoveries += 1
+            self.steps[step] += 1
+            self.last_step = step
+            self.last_ttr = ttr
+            self.total_down += ttr
+            if ttr > self.max_ttr:
+                self.max_ttr = ttr
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "outages": self.outages,
+                "recoveries": self.recoveries,
+                "attempts": self.attempts,
+                "steps": dict(self.steps),
+                "last_step": self.last_step,
+                "last_ttr_ms": round(self.last_ttr * 1000, 1) if self.last_ttr is not None else None,
+                "max_ttr_ms": round(self.max_ttr * 1000, 1),
+                "total_down_s": round(self.total_down, 1),
+            }
+
+
+class ReaderRecovery:
+    """PN532の段階的な自動復旧
+
+    SAM設定のやり直し → PN532の再初期化 → I2Cバスの作り直し の順に試し、
+    すべて失敗した場合は initial_backoff 秒から max_backoff 秒まで倍々に待って繰り返す。
+    アプリケーションやTkを再起動せずに、復旧した時点で読み取りループが再開する。
+    """
+
+    def __init__(self, station, initial_backoff=0.5, max_backoff=30.0, backoff_factor=2.0,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.station = station
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.backoff_factor = backoff_factor
+        self.clock = clock
+        self.sleep = sleep
+        self.stats = RecoveryStats()
+
+    @classmethod
+    def from_settings(cls, station, settings):
+        """設定（SETTINGS['recovery']）から生成"""
+        return cls(
+            station,
+            initial_backoff=settings.get('initial_backoff', 0.5),
+            max_backoff=settings.get('max_backoff', 30.0),
+            backoff_factor=settings.get('backoff_factor', 2.0),
+        )
+
+    def recover(self, should_continue, on_status=None, down_since=None):
+        """復旧するまで再初期化を繰り返す（復旧したら True、中止されたら False）"""
+        def status(message, status_type="info"):
+            if on_status:
+                on_status(message, status_type)
+
+        name = self.station.name
+        down_since = down_since if down_since is not None else self.clock()
+        backoff = self.initial_backoff
+        self.stats.record_outage()
+        status(f"{name}: 通信エラー - 自動復旧中...", "warning")
+        while should_continue():
+            for step in RECOVERY_STEPS:
+                if not should_continue():
+                    break
+                self.stats.record_attempt()
+                try:
+                    self.station.reinitialize(step)
+                except Exception as e:
+                    logger.warning(f"{name}: 復旧失敗 ({step}): {e}")
+                    continue
+                ttr = self.clock() - down_since
+                self.stats.record_recovery(step, ttr)
+                logger.info(f"{name}: 復旧しました ({step}, 停止時間 {ttr:.2f}s)")
+                status(f"{name}: 復旧しました ({ttr:.1f}秒)", "success")
+                return True
+            status(f"{name}: 復旧できません - {backoff:.1f}秒後に再試行します", "error")
+            self._wait(backoff, should_continue)
+            backoff = min(self.max_backoff, backoff * self.backoff_factor)
+        logger.info(f"{name}: 復旧を中止しました")
+        return False
+
+    def _wait(self, seconds, should_continue):
+        """停止要求に素早く応じられるよう、短く区切って待つ"""
+        deadline = self.clock() + seconds
+        while should_continue():
+            remaining = deadline - self.clock()
+            if remaining <= 0:
+                return
+            self.sleep(min(remaining, 0.1))
@@ -0,0 +1,143 @@
+import queue
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# adafruit_pn532 の call_function の既定タイムアウト（秒）
+DEFAULT_COMMAND_TIMEOUT = 1.0
+
+
+class ReaderStallError(Exception):
+    """PN532のコマンドが期限までに戻らなかった"""
+
+    def __init__(self, command, elapsed=None):
+        self.command = command
+        self.elapsed = elapsed
+        if elapsed is None:
+            message = f"応答しなくなったリーダーは使用できません（停止したコマンド: {command}）"
+        else:
+            message = f"{command} が {elapsed * 1000:.0f}ms 応答しません"
+        super().__init__(message)
+
+
+class WatchdogPN532:
+    """PN532の各コマンドに期限を設けるラッパー
+
+    コマンドは専用のスレッドで実行し、呼び出し側は
+    「コマンド自身のタイムアウトの2倍 + margin 秒」まで待つ（adafruit_pn532 は ACK と応答を
+    それぞれタイムアウトまで待つため、正常なコマンドでもタイムアウトの2倍かかることがある）。期限を過ぎたら ReaderStallError を送出し、
+    このリーダーは放棄する（以降の呼び出しはすぐに ReaderStallError になり、復旧処理で作り直す）。
+    I2Cで固まったスレッドは止められないため、戻ってきた時点で結果を捨てて終了させる。
+    """
+
+    def __init__(self, pn532, margin=0.5, on_stall=None):
+        self.pn532 = pn532
+        self.margin = margin
+        self.on_stall = on_stall
+        self.requests = queue.Queue()
+        # 実行中のコマンド名と開始時刻
+        self.current = None
+        # 期限切れになったコマンド名（放棄済みの場合）
+        self.abandoned = None
+        self.worker = threading.Thread(target=self._worker, daemon=True)
+        self.worker.start()
+
+    @property
+    def firmware_version(self):
+        return self._call("firmware_version", lambda: self.pn532.firmware_version)
+
+    def __getattr__(self, name):
+        attr = getattr(self.pn532, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            return self._call(name, attr, *args, **kwargs)
+        return call
+
+    def close(self):
+        """コマンド実行スレッドを終了"""
+        self.requests.put(None)
+
+    def _call(self, command, func, *args, **kwargs):
+        if self.abandoned is not None:
+            raise ReaderStallError(self.abandoned)
+        if command == "call_function" and args:
+            command = f"call_function 0x{args[0]:02X}"
+        limit = 2 * kwargs.get('timeout', DEFAULT_COMMAND_TIMEOUT) + self.margin
+        done = threading.Event()
+        box = {}
+        started = time.monotonic()
+        self.requests.put((command, func, args, kwargs, done, box))
+        if not done.wait(limit):
+            elapsed = time.monotonic() - started
+            self.abandoned = command
+            logger.error(f"PN532コマンド応答なし: {command} ({elapsed * 1000:.0f}ms)")
+            if self.on_stall:
+                self.on_stall(command, elapsed)
+            raise ReaderStallError(command, elapsed)
+        if 'error' in box:
+            raise box['error']
+        return box.get('result')
+
+    def _worker(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            command, func, args, kwargs, done, box = request
+            self.current = (command, time.monotonic())
+            try:
+                box['result'] = func(*args, **kwargs)
+            except Exception as e:
+                box['error'] = e
+            self.current = None
+            done.set()
+            if self.abandoned is not None:
+                logger.warning(f"応答しなかったPN532コマンドが戻りました。結果を破棄します: {command}")
+                return
+
+
+class WorkerWatchdog:
+    """ポーリングワーカーの生存監視
+
+    各リーダーのポーリングワーカーは周回ごとに heartbeat を更新する。
+    timeout 秒以上更新されないワーカーは固まったとみなし、リーダーを再初期化扱いにして
+    新しいワーカーを起動する（古いワーカーは戻ってきた時点で終了する）。
+    """
+
+    def __init__(self, stations, timeout=10.0, interval=0.2):
+        self.stations = stations
+        self.timeout = timeout
+        self.interval = interval
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def _loop(self):
+        while self.running:
+            now = time.monotonic()
+            for station in self.stations:
+                if not station.running or station.heartbeat is None:
+                    continue
+                stalled = now - station.heartbeat
+                if stalled < self.timeout:
+                    continue
+                command = station.current_command()
+                logger.error(f"{station.name}: ポーリングワーカーが {stalled:.1f}s 応答しません"
+                             f"（実行中のコマンド: {command or '不明'}）。ワーカーを再起動します")
+                station.restart_worker(command or "poll worker", stalled)
+            time.sleep(self.interval)
@@ -0,0 +1,134 @@
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# タグへのコマンド
+CMD_GET_VERSION = 0x60
+# Capability Container はページ3
+CC_PAGE = 3
+CC_MAGIC = 0xE1
+
+
+class TagCapability:
+    """タグ種別ごとの容量と利用できるコマンド"""
+
+    def __init__(self, name, capacity, last_user_page, fast_read=False, get_version=False):
+        self.name = name
+        # NDEFに使えるユーザー領域のバイト数
+        self.capacity = capacity
+        self.last_user_page = last_user_page
+        self.fast_read = fast_read
+        self.get_version = get_version
+
+    def __repr__(self):
+        return (f"TagCapability({self.name}, capacity={self.capacity}, "
+                f"last_user_page={self.last_user_page}, fast_read={self.fast_read})")
+
+
+# GET_VERSION の (製品種別, ストレージサイズ) → タグ種別
+VERSION_TABLE = {
+    (0x04, 0x0F): TagCapability("NTAG213", 144, 39, fast_read=True, get_version=True),
+    (0x04, 0x11): TagCapability("NTAG215", 496, 129, fast_read=True, get_version=True),
+    (0x04, 0x13): TagCapability("NTAG216", 872, 225, fast_read=True, get_version=True),
+    (0x03, 0x0B): TagCapability("MF0UL11", 48, 15, fast_read=True, get_version=True),
+    (0x03, 0x0E): TagCapability("MF0UL21", 128, 35, fast_read=True, get_version=True),
+}
+
+# GET_VERSION 非対応の MIFARE Ultralight
+ULTRALIGHT = TagCapability("MIFARE Ultralight", 48, 15)
+# 判定できない場合は従来どおり NTAG213 とみなす
+DEFAULT_CAPABILITY = TagCapability("unknown", 144, 39)
+
+
+def capability_from_cc(cc):
+    """Capability Container（4バイト）から容量だけ分かるタグ種別を作る
+
+    対応コマンドは分からないため、FAST_READ などは使わない前提とする。
+    """
+    if cc is None or len(cc) < 4 or cc[0] != CC_MAGIC:
+        return None
+    capacity = cc[2] * 8
+    if capacity == ULTRALIGHT.capacity:
+        return ULTRALIGHT
+    return TagCapability(f"CC {capacity}B", capacity, 3 + capacity // 4)
+
+
+class CapabilityCache:
+    """タグ種別をUIDごと（とUIDの製造者プレフィックスごと）にキャッシュする
+
+    初めてのUIDでも、同じ製造者プレフィックスのタグ種別が分かっていれば
+    CCページの読み取り1回で容量が一致することだけ確認し、GET_VERSION を省略する。
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.by_uid = OrderedDict()
+        self.by_prefix = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def prefix_of(uid):
+        """製造者コード（UID先頭バイト）とUID長"""
+        return bytes(uid[:1]), len(uid)
+
+    def get(self, uid):
+        """キャッシュ済みのタグ種別（無ければ None）"""
+        with self.lock:
+            capability = self.by_uid.get(bytes(uid))
+            if capability is not None:
+                self.by_uid.move_to_end(bytes(uid))
+            return capability
+
+    def put(self, uid, capability):
+        """タグ種別を記録"""
+        with self.lock:
+            self.by_uid[bytes(uid)] = capability
+            self.by_uid.move_to_end(bytes(uid))
+            while len(self.by_uid) > self.max_entries:
+                self.by_uid.popitem(last=False)
+            if capability.get_version:
+                self.by_prefix[self.prefix_of(uid)] = capability
+
+    def detect(self, session):
+        """タグ種別を判定（キャッシュが無い場合のみタグに問い合わせる）"""
+        uid = session.uid
+        capability = self.get(uid)
+        if capability is not None:
+            return capability
+
+        with self.lock:
+            hint = self.by_prefix.get(self.prefix_of(uid))
+
+        cc = None
+        try:
+            block = session.mifare_classic_read_block(CC_PAGE)
+            if block is not None:
+                cc = block[0:4]
+        except Exception as e:
+            logger.debug(f"CCページ読み取りエラー: {e}")
+        from_cc = capability_from_cc(cc)
+
+        if hint is not None and from_cc is not None and from_cc.capacity == hint.capacity:
+            capability = hint
+        else:
+            capability = self._get_version(session) or from_cc
+        if capability is None:
+            logger.warning(f"タグ種別を判定できません。既定値を使用します: {uid.hex()}")
+            return DEFAULT_CAPABILITY
+
+        logger.info(f"タグ種別判定: {uid.hex()} -> {capability}")
+        self.put(uid, capability)
+        return capability
+
+    def _get_version(self, session):
+        """GET_VERSION でタグ種別を問い合わせる"""
+        try:
+            version = session.communicate_thru(bytes([CMD_GET_VERSION]), 8, retry=False)
+        except Exception as e:
+            logger.debug(f"GET_VERSION エラー: {e}")
+            return None
+        if version is None or len(version) < 8:
+            return None
+        return VERSION_TABLE.get((version[2], version[6]))
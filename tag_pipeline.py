@@ -0,0 +1,201 @@
+import queue
+import threading
+import time
+import logging
+import traceback
+
+logger = logging.getLogger(__name__)
+
+# ワーカー停止用の番兵
+_STOP = object()
+
+
+class StageStats:
+    """ステージごとのレイテンシカウンタ"""
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.count = 0
+        self.errors = 0
+        self.dropped = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.last_time = 0.0
+        self.total_wait = 0.0
+
+    def record(self, elapsed, wait=0.0, error=False):
+        """処理時間を記録"""
+        with self.lock:
+            self.count += 1
+            self.total_time += elapsed
+            self.total_wait += wait
+            self.last_time = elapsed
+            if elapsed > self.max_time:
+                self.max_time = elapsed
+            if error:
+                self.errors += 1
+
+    def record_drop(self):
+        """キュー満杯による破棄を記録"""
+        with self.lock:
+            self.dropped += 1
+
+    def snapshot(self):
+        """現在の統計値を辞書で返す"""
+        with self.lock:
+            avg = self.total_time / self.count if self.count else 0.0
+            avg_wait = self.total_wait / self.count if self.count else 0.0
+            return {
+                "count": self.count,
+                "errors": self.errors,
+                "dropped": self.dropped,
+                "avg_ms": round(avg * 1000, 1),
+                "max_ms": round(self.max_time * 1000, 1),
+                "last_ms": round(self.last_time * 1000, 1),
+                "avg_wait_ms": round(avg_wait * 1000, 1),
+            }
+
+
+class TagJob:
+    """パイプラインを流れる1タップ分の処理単位"""
+
+    def __init__(self, uid, station=None, target=1, selected=True):
+        self.uid = uid
+        self.uid_str = uid.hex()
+        # 検出したリーダー（複数リーダー構成で書き込み・通知に使う）
+        self.station = station
+        # PN532上のターゲット番号と、検出時の選択がそのまま使えるか
+        self.target = target
+        self.selected = selected
+        self.detected_at = time.monotonic()
+        self.enqueued_at = self.detected_at
+        self.write_ok = None
+        self.notify_ok = None
+        # 書き込みステージがリーダーを使い終わったら立つ
+        self.reader_done = threading.Event()
+
+
+class TagPipeline:
+    """検出・書き込み・通知を有界キューで繋いだ処理パイプライン
+
+    検出ステージは呼び出し側の読み取りループが担当し、submit() でジョブを投入する。
+    書き込みと通知はそれぞれ専用のワーカースレッドで処理されるため、
+    Bluetooth送信中も次のタグのポーリングを続けられる。
+    """
+
+    def __init__(self, write_handler, notify_handler, write_queue_size=4, notify_queue_size=16,
+                 submit_timeout=1.0, write_workers=1):
+        self.write_handler = write_handler
+        self.notify_handler = notify_handler
+        self.submit_timeout = submit_timeout
+        # リーダーが複数ある場合は書き込みワーカーも複数にして並行に書き込む
+        self.write_workers = write_workers
+        self.write_queue = queue.Queue(maxsize=write_queue_size)
+        self.notify_queue = queue.Queue(maxsize=notify_queue_size)
+        self.stats = {
+            "detect": StageStats("detect"),
+            "write": StageStats("write"),
+            "notify": StageStats("notify"),
+        }
+        self.workers = []
+        self.running = False
+
+    def start(self):
+        """書き込み・通知ワーカーを起動"""
+        if self.running:
+            return
+        self.running = True
+        self.workers = [
+            threading.Thread(target=self._stage_worker,
+                             args=("write", self.write_queue, self._run_write), daemon=True)
+            for _ in range(self.write_workers)
+        ]
+        self.workers.append(threading.Thread(target=self._stage_worker,
+                                             args=("notify", self.notify_queue, self._run_notify), daemon=True))
+        for worker in self.workers:
+            worker.start()
+        logger.info("タグ処理パイプライン開始")
+
+    def stop(self, timeout=2.0):
+        """ワーカーを停止"""
+        if not self.running:
+            return
+        self.running = False
+        for q in [self.write_queue] * self.write_workers + [self.notify_queue]:
+            try:
+                q.put(_STOP, timeout=timeout)
+            except queue.Full:
+                logger.warning("パイプライン停止: キューが満杯のため番兵を投入できません")
+        for worker in self.workers:
+            worker.join(timeout)
+        self.workers = []
+        logger.info(f"タグ処理パイプライン停止 - 統計: {self.stats_snapshot()}")
+
+    def record_detect(self, elapsed):
+        """検出ステージのレイテンシを記録"""
+        self.stats["detect"].record(elapsed)
+
+    def submit(self, job):
+        """検出したタグを書き込みステージへ投入
+
+        キューが満杯の場合は submit_timeout まで待ち、それでも空かなければ破棄して False を返す。
+        """
+        job.enqueued_at = time.monotonic()
+        try:
+            self.write_queue.put(job, timeout=self.submit_timeout)
+            return True
+        except queue.Full:
+            logger.warning(f"書き込みキューが満杯のためタグを破棄: {job.uid_str}")
+            self.stats["write"].record_drop()
+            job.reader_done.set()
+            return False
+
+    def queue_depths(self):
+        """各キューの滞留数"""
+        return {"write": self.write_queue.qsize(), "notify": self.notify_queue.qsize()}
+
+    def stats_snapshot(self):
+        """全ステージの統計"""
+        snapshot = {name: stats.snapshot() for name, stats in self.stats.items()}
+        snapshot["queues"] = self.queue_depths()
+        return snapshot
+
+    def _stage_worker(self, name, in_queue, run):
+        """ステージ共通のワーカーループ"""
+        logger.info(f"パイプラインステージ開始: {name}")
+        while True:
+            job = in_queue.get()
+            if job is _STOP:
+                break
+            wait = time.monotonic() - job.enqueued_at
+            started = time.monotonic()
+            error = False
+            try:
+                run(job)
+            except Exception as e:
+                error = True
+                logger.error(f"パイプラインステージ {name} エラー: {e}")
+                logger.error(f"詳細エラー情報: {traceback.format_exc()}")
+            finally:
+                elapsed = time.monotonic() - started
+                self.stats[name].record(elapsed, wait=wait, error=error)
+                logger.debug(f"ステージ {name} 完了: {job.uid_str} 処理 {elapsed * 1000:.1f}ms 待ち {wait * 1000:.1f}ms")
+        logger.info(f"パイプラインステージ終了: {name}")
+
+    def _run_write(self, job):
+        """書き込みステージ: 完了後に通知ステージへ渡す"""
+        try:
+            job.write_ok = self.write_handler(job)
+        finally:
+            job.reader_done.set()
+        job.enqueued_at = time.monotonic()
+        try:
+            self.notify_queue.put(job, timeout=self.submit_timeout)
+        except queue.Full:
+            logger.warning(f"通知キューが満杯のためタグを破棄: {job.uid_str}")
+            self.stats["notify"].record_drop()
+
+    def _run_notify(self, job):
+        """通知ステージ"""
+        job.notify_ok = self.notify_handler(job)
@@ -0,0 +1,97 @@
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+PRESENT = "present"
+PROCESSED = "processed"
+FAILED = "failed"
+
+
+class _Presence:
+    """リーダー上にある1枚のタグの状態"""
+
+    def __init__(self, state, since):
+        self.state = state
+        self.since = since
+        self.misses = 0
+
+
+class TagPresenceTracker:
+    """リーダー上のタグの在否を追跡する状態機械
+
+    タグごとに absent → present → processed → removed → absent と遷移する。
+    短いタイムアウトのポーリングで連続 removal_misses 回検出されなければ取り去られたとみなす。
+    処理済みのUIDはリーダー上にある間と、取り去られてから suppress_ttl 秒間は再処理しない。
+    処理に失敗したUID（failed）もリーダー上にある間は再処理しないが、取り去られたら抑制せず、
+    かざし直しですぐ処理し直す（容量超過や書き込み禁止のタグでポーリングごとに書き込みを繰り返さない）。
+    複数枚を同時に検出するポーリングにも対応し、新しく現れたUIDはすぐ処理対象とする。
+    """
+
+    def __init__(self, removal_misses=2, suppress_ttl=2.0, clock=time.monotonic):
+        self.removal_misses = removal_misses
+        self.suppress_ttl = suppress_ttl
+        self.clock = clock
+        # リーダー上のUID → 状態
+        self.present = {}
+        # 取り去られた処理済みUID → 取り去られた時刻
+        self.recent = {}
+
+    def observe(self, uid):
+        """ポーリング結果（UID または None）を反映し、処理すべき新しいタグであれば True を返す"""
+        return bool(self.observe_all([] if uid is None else [uid]))
+
+    def observe_all(self, uids):
+        """1回のポーリングで検出したUIDの一覧を反映し、処理すべき新しいUIDを返す"""
+        now = self.clock()
+        self._expire(now)
+        seen = [bytes(uid) for uid in uids]
+
+        for uid, entry in list(self.present.items()):
+            if uid in seen:
+                # かざされたまま
+                entry.misses = 0
+                continue
+            entry.misses += 1
+            if entry.misses >= self.removal_misses:
+                self._removed(uid, now)
+
+        new = []
+        for uid in seen:
+            if uid in self.present:
+                continue
+            if uid in self.recent:
+                # 取り去られてから間もない処理済みタグ
+                logger.debug(f"処理済みタグの再検出を抑制: {uid.hex()}")
+                self.present[uid] = _Presence(PROCESSED, now)
+                continue
+            self.present[uid] = _Presence(PRESENT, now)
+            new.append(uid)
+        return new
+
+    def mark_processed(self, uid):
+        """パイプラインへの投入が終わったタグを処理済みにする"""
+        entry = self.present.get(bytes(uid))
+        if entry is not None and entry.state == PRESENT:
+            entry.state = PROCESSED
+
+    def mark_failed(self, uid):
+        """処理に失敗したタグを、取り去られるまで再処理しない状態にする"""
+        entry = self.present.get(bytes(uid))
+        if entry is not None and entry.state == PRESENT:
+            entry.state = FAILED
+
+    def _removed(self, uid, now):
+        """タグが取り去られた"""
+        entry = self.present.pop(uid)
+        if entry.state == PROCESSED:
+            self.recent[uid] = now
+        logger.debug(f"タグ取り去り検出: {uid.hex()} (在席 {now - entry.since:.2f}s)")
+
+    def _expire(self, now):
+        """TTLを過ぎた抑制を解除"""
+        if not self.recent:
+            return
+        expired = [uid for uid, removed_at in self.recent.items() if now - removed_at >= self.suppress_ttl]
+        for uid in expired:
+            del self.recent[uid]
@@ -0,0 +1,276 @@
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# PN532 InDataExchange（Tg番号で指定したターゲットとのデータ交換）
+IN_DATA_EXCHANGE = 0x40
+# PN532 InCommunicateThru（タグへのコマンドをそのまま中継）
+IN_COMMUNICATE_THRU = 0x42
+# PN532 InListPassiveTarget / InSelect
+IN_LIST_PASSIVE_TARGET = 0x4A
+IN_SELECT = 0x54
+# 106kbps Type A
+BAUD_106K_TYPE_A = 0x00
+# PN532が同時に扱えるターゲット数
+MAX_TARGETS = 2
+
+# タグへのコマンド
+CMD_READ = 0x30
+CMD_WRITE = 0xA2
+
+
+class TagLostError(Exception):
+    """タグが離された、または別のタグに入れ替わった"""
+
+
+class PassiveTarget:
+    """InListPassiveTarget で検出したターゲット"""
+
+    def __init__(self, number, uid, sel_res=0):
+        # PN532がターゲットに割り当てた番号（Tg、1から）
+        self.number = number
+        self.uid = uid
+        self.sel_res = sel_res
+
+    def __repr__(self):
+        return f"PassiveTarget(Tg={self.number}, uid={self.uid.hex()})"
+
+
+def parse_target_list(response):
+    """InListPassiveTarget（106kbps Type A）の応答をターゲットの一覧に変換"""
+    targets = []
+    if not response:
+        return targets
+    pos = 1
+    for _ in range(response[0]):
+        # Tg, SENS_RES(2), SEL_RES, NFCIDLength, NFCID...
+        if pos + 5 > len(response):
+            break
+        number = response[pos]
+        sel_res = response[pos + 3]
+        uid_length = response[pos + 4]
+        uid = bytes(response[pos + 5:pos + 5 + uid_length])
+        pos += 5 + uid_length
+        if sel_res & 0x20 and pos < len(response):
+            # ISO14443-4 対応カードは ATS が続く（先頭の TL は自身を含む長さ）
+            pos += response[pos]
+        targets.append(PassiveTarget(number, uid, sel_res))
+    return targets
+
+
+def list_passive_targets(pn532, max_targets=MAX_TARGETS, timeout=1):
+    """InListPassiveTarget で最大 max_targets 枚を同時に検出する（無ければ空リスト）"""
+    response = pn532.call_function(IN_LIST_PASSIVE_TARGET, params=[max_targets, BAUD_106K_TYPE_A],
+                                   response_length=64, timeout=timeout)
+    return parse_target_list(response)
+
+
+class TagSession:
+    """1回の選択でタグへの読み書き・検証を行うセッション
+
+    PN532と同じ ntag2xx_write_block / mifare_classic_read_block などを提供するため、
+    書き込み処理には pn532 の代わりにそのまま渡せる。
+    コマンドが失敗した場合のみ再選択して再試行し、各コマンドの所要時間を記録する。
+
+    max_targets が2以上の場合は複数枚が同時にかざされている前提で、
+    選択は InListPassiveTarget で一覧を取り直してUIDが一致するターゲットを探し、
+    読み書きはそのTg番号を指定した InDataExchange で行う。
+    """
+
+    def __init__(self, pn532, uid=None, selected=False, select_timeout=0.2, retries=2,
+                 target=1, max_targets=1):
+        self.pn532 = pn532
+        self.uid = bytes(uid) if uid is not None else None
+        # 検出直後に開始する場合、InListPassiveTargetによる選択は済んでいる
+        self.selected = selected and uid is not None
+        self.select_timeout = select_timeout
+        self.retries = retries
+        self.max_targets = max_targets
+        self.target = target
+        # InCommunicateThru の送り先になっているターゲット（不明な場合は None）
+        self.active_target = target if max_targets == 1 else None
+        self.log = []
+        self.reselects = 0
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        if not self.selected:
+            self.select()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        summary = self.summary()
+        logger.debug(f"タグセッション終了: {summary}")
+        for entry in self.log:
+            logger.debug(f"  {entry['command']} {entry['arg']} {entry['ms']}ms "
+                         f"{'OK' if entry['ok'] else 'NG'} (試行 {entry['attempt']})")
+        return False
+
+    def select(self):
+        """ターゲットを選択する（UIDが決まっている場合は同じタグであることを確認）"""
+        if self.max_targets > 1:
+            return self._select_from_list()
+        started = time.monotonic()
+        uid = self.pn532.read_passive_target(timeout=self.select_timeout)
+        self._record("select", "", started, uid is not None, 1)
+        if uid is None:
+            self.selected = False
+            raise TagLostError("タグが検出されません")
+        if self.uid is not None and bytes(uid) != self.uid:
+            self.selected = False
+            raise TagLostError(f"別のタグが検出されました: {bytes(uid).hex()}")
+        self.uid = bytes(uid)
+        self.selected = True
+        return self.uid
+
+    def _select_from_list(self):
+        """ターゲット一覧を取り直し、このセッションのUIDのTg番号を選ぶ"""
+        started = time.monotonic()
+        targets = list_passive_targets(self.pn532, self.max_targets, timeout=self.select_timeout)
+        self._record("select", f"{len(targets)} targets", started, bool(targets), 1)
+        if not targets:
+            self.selected = False
+            raise TagLostError("タグが検出されません")
+        if self.uid is None:
+            found = targets[0]
+        else:
+            found = next((target for target in targets if target.uid == self.uid), None)
+            if found is None:
+                self.selected = False
+                raise TagLostError(f"別のタグが検出されました: {', '.join(t.uid.hex() for t in targets)}")
+        self.uid = found.uid
+        self.target = found.number
+        self.active_target = found.number if len(targets) == 1 else None
+        self.selected = True
+        return self.uid
+
+    def mifare_classic_read_block(self, page):
+        """READ: 指定ページから4ページ（16バイト）を読み取る"""
+        if self.max_targets > 1:
+            return self._run("READ", page, self._exchange_read, page)
+        return self._run("READ", page, self.pn532.mifare_classic_read_block, page)
+
+    def ntag2xx_read_block(self, page):
+        """READ: 指定ページの4バイトを読み取る"""
+        block = self.mifare_classic_read_block(page)
+        if block is None:
+            return None
+        return block[0:4]
+
+    def ntag2xx_write_block(self, page, data):
+        """WRITE: 1ページ（4バイト）を書き込む"""
+        if self.max_targets > 1:
+            return self._run("WRITE", page, self._exchange_write, page, data)
+        return self._run("WRITE", page, self.pn532.ntag2xx_write_block, page, data)
+
+    def _exchange_read(self, page):
+        """Tg番号を指定した InDataExchange で READ"""
+        response = self.pn532.call_function(IN_DATA_EXCHANGE, params=[self.target, CMD_READ, page & 0xFF],
+                                            response_length=17)
+        self.active_target = self.target
+        if response is None or len(response) < 17 or response[0] != 0x00:
+            return None
+        return response[1:]
+
+    def _exchange_write(self, page, data):
+        """Tg番号を指定した InDataExchange で WRITE"""
+        params = bytes([self.target, CMD_WRITE, page & 0xFF]) + bytes(data)
+        response = self.pn532.call_function(IN_DATA_EXCHANGE, params=params, response_length=1)
+        self.active_target = self.target
+        return response is not None and len(response) > 0 and response[0] == 0x00
+
+    def _activate(self):
+        """InCommunicateThru の前に、このセッションのターゲットを InSelect で送り先にする"""
+        if self.active_target == self.target:
+            return
+        started = time.monotonic()
+        response = self.pn532.call_function(IN_SELECT, response_length=1, params=[self.target])
+        ok = response is not None and len(response) > 0 and response[0] == 0x00
+        self._record("INSELECT", self.target, started, ok, 1)
+        if not ok:
+            raise TagLostError(f"ターゲット {self.target} を選択できません")
+        self.active_target = self.target
+
+    def _thru(self, data, response_length, timeout):
+        """InCommunicateThru（応答はステータスバイト付き）"""
+        self._activate()
+        return self.pn532.call_function(IN_COMMUNICATE_THRU, response_length=response_length + 1,
+                                        params=data, timeout=timeout)
+
+    def call_function(self, command, response_length=0, params=(), timeout=1):
+        """任意のPN532コマンドを実行"""
+        return self._run(f"CMD 0x{command:02X}", bytes(params[:3]).hex(), self.pn532.call_function,
+                         command, response_length=response_length, params=params, timeout=timeout)
+
+    def communicate_thru(self, data, response_length, timeout=1, retry=True):
+        """InCommunicateThruでタグのコマンドを直接送信し、ステータスを除いた応答を返す
+
+        retry=False の場合、失敗しても再試行せずに再選択だけ行って None を返す
+        （GET_VERSION 非対応タグのように失敗がタグを停止させるコマンド向け）。
+        """
+        name = f"THRU 0x{data[0]:02X}"
+        if retry:
+            response = self._run(name, bytes(data[1:]).hex(), self._thru, data, response_length, timeout)
+        else:
+            started = time.monotonic()
+            try:
+                response = self._thru(data, response_length, timeout)
+            except Exception as e:
+                logger.debug(f"{name} エラー: {e}")
+                response = None
+            ok = response is not None and len(response) > 0 and response[0] == 0x00
+            self._record(name, bytes(data[1:]).hex(), started, ok, 1)
+            if not ok:
+                self.reselects += 1
+                self.select()
+                return None
+        if response is None or len(response) == 0 or response[0] != 0x00:
+            return None
+        return response[1:]
+
+    def summary(self):
+        """セッションの集計"""
+        total = time.monotonic() - self.started if self.started else 0.0
+        failures = sum(1 for entry in self.log if not entry['ok'])
+        return {
+            "uid": self.uid.hex() if self.uid else None,
+            "commands": len(self.log),
+            "failures": failures,
+            "reselects": self.reselects,
+            "total_ms": round(total * 1000, 1),
+        }
+
+    def _run(self, command, arg, func, *args, **kwargs):
+        """コマンドを実行し、失敗時は再選択して再試行する"""
+        attempt = 0
+        while True:
+            attempt += 1
+            started = time.monotonic()
+            error = None
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                result = None
+                error = e
+            ok = error is None and result is not None and result is not False
+            self._record(command, arg, started, ok, attempt)
+            if ok:
+                return result
+            if attempt > self.retries:
+                if error is not None:
+                    raise error
+                return result
+            logger.debug(f"{command} {arg} 失敗（試行 {attempt}）: {error}。再選択します")
+            self.reselects += 1
+            self.select()
+
+    def _record(self, command, arg, started, ok, attempt):
+        self.log.append({
+            "command": command,
+            "arg": arg,
+            "ms": round((time.monotonic() - started) * 1000, 2),
+            "ok": ok,
+            "attempt": attempt,
+        })
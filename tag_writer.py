@@ -0,0 +1,212 @@
+import time
+import logging
+
+from ndef_codec import (NDEF_START_PAGE, PAGE_SIZE, DEFAULT_CAPACITY, FINGERPRINT_PAGES,
+                        iter_pages, page_count, tlv_span, fingerprint_page, parse_user_area, with_fingerprint)
+
+logger = logging.getLogger(__name__)
+
+
+class WriteResult:
+    """タグ書き込み結果"""
+
+    def __init__(self):
+        self.written = 0
+        self.skipped = 0
+        self.cleared = 0
+        self.verify = None
+
+    def __repr__(self):
+        return f"WriteResult(written={self.written}, skipped={self.skipped}, cleared={self.cleared})"
+
+
+# READコマンドは1回で4ページ（16バイト）を返す
+READ_BURST_PAGES = 4
+# FAST_READ（NTAG21x / Ultralight EV1）
+CMD_FAST_READ = 0x3A
+FAST_READ_MAX_PAGES = 60
+
+
+def read_pages(pn532, start_page, count):
+    """count ページ分を16バイト単位のREADでまとめて読み取る"""
+    data = bytearray()
+    end_page = start_page + count
+    page = start_page
+    while page < end_page:
+        block = pn532.mifare_classic_read_block(page)
+        if block is None:
+            raise RuntimeError(f"ページ {page} の読み取りが失敗しました")
+        data += block[:min(READ_BURST_PAGES, end_page - page) * PAGE_SIZE]
+        page += READ_BURST_PAGES
+    return bytes(data)
+
+
+def read_existing_span(pn532, start_page=NDEF_START_PAGE):
+    """既存のNDEF TLVが占めるバイト数を先頭4ページの読み取り1回で求める"""
+    head = pn532.mifare_classic_read_block(start_page)
+    if head is None:
+        return 0
+    return tlv_span(head)
+
+
+def write_block(pn532, page, block):
+    """1ページ書き込み。失敗時は例外"""
+    if not pn532.ntag2xx_write_block(page, block):
+        raise RuntimeError(f"ページ {page} の書き込みが失敗しました")
+
+
+def write_pages(pn532, data, start_page=NDEF_START_PAGE):
+    """データをページ単位で書き込み、書き込んだページ数を返す"""
+    written = 0
+    for page, block in iter_pages(data, start_page):
+        write_block(pn532, page, block)
+        written += 1
+    return written
+
+
+def write_ndef(pn532, tlv, start_page=NDEF_START_PAGE, capacity=DEFAULT_CAPACITY, clear_stale=False,
+               delta=False):
+    """TLVが占めるページだけを書き込む（tlv にはフィンガープリント付きのデータも渡せる）
+
+    delta が有効な場合は対象ページを16バイト単位で読み取り、内容が異なるページだけを書き込む。
+    clear_stale が有効な場合は新しいTLVより後ろに古いTLVのデータが残っているページだけを0で埋める。
+    """
+    if len(tlv) > capacity:
+        raise ValueError(f"TLVがタグ容量を超えています: {len(tlv)} > {capacity} バイト")
+
+    result = WriteResult()
+    new_pages = page_count(len(tlv))
+    current = None
+    old_span = 0
+    if delta:
+        try:
+            current = read_pages(pn532, start_page, new_pages)
+            old_span = tlv_span(current[:READ_BURST_PAGES * PAGE_SIZE])
+        except Exception as e:
+            logger.debug(f"差分書き込み用の読み取りエラー。全ページ書き込みに切り替えます: {e}")
+            current = None
+    elif clear_stale:
+        try:
+            old_span = read_existing_span(pn532, start_page)
+        except Exception as e:
+            logger.debug(f"既存TLVの読み取りエラー: {e}")
+
+    for page, block in iter_pages(tlv, start_page):
+        offset = (page - start_page) * PAGE_SIZE
+        if current is not None and current[offset:offset + PAGE_SIZE] == block:
+            result.skipped += 1
+            continue
+        write_block(pn532, page, block)
+        result.written += 1
+
+    old_pages = page_count(min(old_span, capacity))
+    if old_pages:
+        # 古いTLVの後ろに置かれたフィンガープリントも消去対象に含める
+        old_pages = min(old_pages + FINGERPRINT_PAGES, page_count(capacity))
+    if clear_stale and old_pages > new_pages:
+        stale = bytes((old_pages - new_pages) * PAGE_SIZE)
+        result.cleared = write_pages(pn532, stale, start_page + new_pages)
+
+    logger.debug(f"NDEF書き込み: {result}")
+    return result
+
+
+def read_ndef_records(pn532, start_page=NDEF_START_PAGE, capacity=DEFAULT_CAPACITY):
+    """タグのNDEFメッセージを読み取り、レコードのリストを返す"""
+    head = read_pages(pn532, start_page, READ_BURST_PAGES)
+    span = min(tlv_span(head), capacity)
+    if span == 0:
+        return []
+    data = head
+    if span > len(head):
+        data = head + read_pages(pn532, start_page + READ_BURST_PAGES, page_count(span) - READ_BURST_PAGES)
+    return parse_user_area(data)
+
+
+def rewrite_pages(pn532, tlv, pages, start_page=NDEF_START_PAGE):
+    """指定したページだけを書き直す"""
+    targets = set(pages)
+    for page, block in iter_pages(tlv, start_page):
+        if page in targets:
+            write_block(pn532, page, block)
+
+
+class VerifyResult:
+    """書き込み検証結果"""
+
+    OK = "ok"
+    MISMATCH = "mismatch"
+    TAG_LOST = "tag_lost"
+
+    def __init__(self, status, mismatched_pages=(), elapsed=0.0):
+        self.status = status
+        self.mismatched_pages = list(mismatched_pages)
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.status == self.OK
+
+    def __repr__(self):
+        return (f"VerifyResult({self.status}, mismatched_pages={self.mismatched_pages}, "
+                f"{self.elapsed * 1000:.1f}ms)")
+
+
+def fast_read(pn532, start_page, end_page):
+    """FAST_READ（0x3A）で start_page〜end_page をまとめて読み取る
+
+    PN532のフレーム長に収まるよう FAST_READ_MAX_PAGES ごとに分割する。
+    """
+    data = bytearray()
+    page = start_page
+    while page <= end_page:
+        last = min(end_page, page + FAST_READ_MAX_PAGES - 1)
+        length = (last - page + 1) * PAGE_SIZE
+        block = pn532.communicate_thru(bytes([CMD_FAST_READ, page, last]), length)
+        if block is None or len(block) < length:
+            raise RuntimeError(f"FAST_READ {page}-{last} が失敗しました")
+        data += block[:length]
+        page = last + 1
+    return bytes(data)
+
+
+def verify_write(pn532, tlv, start_page=NDEF_START_PAGE, use_fast_read=True):
+    """書き込んだ範囲を一括で読み戻し、ページ単位で比較する
+
+    FAST_READ が使えるタグでは1回のやり取りで全範囲を読み取る。
+    読み取りに失敗した場合（タグが離された場合を含む）は TAG_LOST を返す。
+    """
+    started = time.monotonic()
+    pages = page_count(len(tlv))
+    try:
+        if use_fast_read:
+            actual = fast_read(pn532, start_page, start_page + pages - 1)
+        else:
+            actual = read_pages(pn532, start_page, pages)
+    except Exception as e:
+        logger.debug(f"書き込み検証の読み取りエラー: {e}")
+        return VerifyResult(VerifyResult.TAG_LOST, elapsed=time.monotonic() - started)
+
+    mismatched = []
+    for page, block in iter_pages(tlv, start_page):
+        offset = (page - start_page) * PAGE_SIZE
+        if actual[offset:offset + PAGE_SIZE] != block:
+            mismatched.append(page)
+    status = VerifyResult.MISMATCH if mismatched else VerifyResult.OK
+    return VerifyResult(status, mismatched, time.monotonic() - started)
+
+
+def check_fingerprint(pn532, tlv, start_page=NDEF_START_PAGE):
+    """TLVの末尾とフィンガープリントをREAD1回で読み取り、TLVが書き込み済みか判定
+
+    READ は4ページ（16バイト）返すので、フィンガープリントの2ページ前から読み、
+    URIの末尾（UIDの部分と終端TLV）までまとめて比較する。他のアプリがNDEFだけを
+    同じ長さの別のURLに書き換え、終端より後ろを残した場合でも一致とはみなさない。
+    """
+    page = max(start_page, fingerprint_page(tlv, start_page) - (READ_BURST_PAGES - FINGERPRINT_PAGES))
+    offset = (page - start_page) * PAGE_SIZE
+    expected = with_fingerprint(tlv)[offset:offset + READ_BURST_PAGES * PAGE_SIZE]
+    block = pn532.mifare_classic_read_block(page)
+    if block is None:
+        return False
+    return bytes(block[:len(expected)]) == expected
@@ -0,0 +1,84 @@
+import base64
+
+# UIDのURLエンコード方式
+#   hex       : 16進数（従来形式、7バイトUIDで14文字）
+#   base62    : [0-9A-Za-z]（7バイトUIDで10文字）
+#   base64url : RFC 4648 URL安全Base64、パディングなし（7バイトUIDで10文字）
+ENCODINGS = ("hex", "base62", "base64url")
+
+BASE62_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+_BASE62_INDEX = {c: i for i, c in enumerate(BASE62_ALPHABET)}
+
+
+def encode_uid(uid, encoding="hex"):
+    """UIDバイト列をURL用の文字列に変換"""
+    uid = bytes(uid)
+    if encoding == "hex":
+        return uid.hex()
+    if encoding == "base64url":
+        return base64.urlsafe_b64encode(uid).rstrip(b"=").decode("ascii")
+    if encoding == "base62":
+        # 先頭の0x00を失わないよう、0x01を前置してから整数として変換する
+        value = int.from_bytes(b"\x01" + uid, "big")
+        chars = []
+        while value:
+            value, rem = divmod(value, 62)
+            chars.append(BASE62_ALPHABET[rem])
+        return "".join(reversed(chars))
+    raise ValueError(f"未対応のエンコード方式: {encoding}")
+
+
+def decode_uid(token, encoding="hex"):
+    """URL中の文字列からUIDバイト列を復元（サーバー側で使用）"""
+    if encoding == "hex":
+        return bytes.fromhex(token)
+    if encoding == "base64url":
+        return base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    if encoding == "base62":
+        value = 0
+        for c in token:
+            if c not in _BASE62_INDEX:
+                raise ValueError(f"base62として不正な文字: {c!r}")
+            value = value * 62 + _BASE62_INDEX[c]
+        raw = value.to_bytes((value.bit_length() + 7) // 8, "big")
+        if not raw or raw[0] != 0x01:
+            raise ValueError(f"base62のUIDとして不正な値: {token}")
+        return raw[1:]
+    raise ValueError(f"未対応のエンコード方式: {encoding}")
+
+
+def build_tag_url(base_url, uid, encoding="hex"):
+    """ベースURLとUIDからタグに書き込むURLを生成"""
+    return f"{base_url}{encode_uid(uid, encoding)}"
+
+
+def parse_tag_url(url, base_url, encoding="hex"):
+    """タグのURLからUIDの16進文字列を取り出す（サーバー側で使用）
+
+    base_url のスキーム・ホストが省略されたパスのみの指定にも対応する。
+    """
+    for prefix in (base_url, base_url.split("://", 1)[-1]):
+        if url.startswith(prefix):
+            token = url[len(prefix):].split("?", 1)[0].split("#", 1)[0].strip("/")
+            return decode_uid(token, encoding).hex()
+    path = "/" + base_url.split("://", 1)[-1].split("/", 1)[-1]
+    if url.startswith(path):
+        token = url[len(path):].split("?", 1)[0].split("#", 1)[0].strip("/")
+        return decode_uid(token, encoding).hex()
+    raise ValueError(f"ベースURLに一致しません: {url}")
+
+
+def url_settings(settings):
+    """設定からベースURLとエンコード方式を決定
+
+    url.encoding が hex 以外で url.compact_base_url（例: https://aks.cloud/q/）が
+    設定されている場合は短いホスト・パスを使用する。
+    """
+    url_settings = settings.get('url', {})
+    base_url = url_settings.get('base_url', 'https://akioka-sub.cloud/questionnaire/')
+    encoding = url_settings.get('encoding', 'hex')
+    if encoding not in ENCODINGS:
+        raise ValueError(f"未対応のエンコード方式: {encoding}")
+    if encoding != "hex" and url_settings.get('compact_base_url'):
+        base_url = url_settings['compact_base_url']
+    return base_url, encoding